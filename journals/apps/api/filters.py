@@ -2,7 +2,7 @@
 from django_filters import rest_framework as filters
 from rest_framework.filters import BaseFilterBackend
 
-from journals.apps.journals.models import JournalAccess, JournalPage, UserPageVisit, Video
+from journals.apps.journals.models import JournalAccess, JournalPage, UserPageVisit, Video, VideoJournal
 
 
 class JournalAccessFilter(filters.FilterSet):
@@ -57,14 +57,11 @@ class JournalAccessFilter(filters.FilterSet):
         """
         if not value:
             return queryset
-        qs = queryset
-        try:
-            journal_pages = JournalPage.objects.filter(videos=Video.objects.get(block_id=value)).distinct().live()
-            journal_uuids = [journal_page.get_journal().uuid for journal_page in journal_pages]
-            qs = queryset.filter(journal__uuid__in=journal_uuids)
-        except Video.DoesNotExist:
-            pass
-        return qs
+        if not Video.objects.filter(block_id=value).exists():
+            return queryset
+
+        journal_uuids = VideoJournal.objects.filter(video__block_id=value).values('journal_uuid')
+        return queryset.filter(journal__uuid__in=journal_uuids)
 
     class Meta:
         model = JournalAccess
@@ -105,18 +102,17 @@ class PageAuthorizationFilter(BaseFilterBackend):
     Filter that only allows user to see pages they have access to.
     """
     def filter_queryset(self, request, queryset, view):
-        # TODO: Currently has additional DB calls for gettings authorized journals and authorized pages attached to
-        # the journals. This happens on every API call
         authorized_journal_ids = JournalAccess.get_user_accessible_journal_ids(request.user)
 
-        authorized_journal_page_ids = JournalPage.objects.filter(
-            journal_about_page__journal__id__in=authorized_journal_ids
-        ).values_list('id', flat=True)
+        # kept as a subquery so the authorized page ids are never loaded into python
+        authorized_journal_pages = JournalPage.objects.filter(
+            journal_about_page__journal_id__in=authorized_journal_ids
+        ).values('id')
 
         authorized_pages = (
             queryset.not_type(JournalPage) |
             queryset.type(JournalPage).filter(
-                id__in=authorized_journal_page_ids
+                id__in=authorized_journal_pages
             )
         )
 
@@ -113,6 +113,9 @@ class SearchMetaDataSerializer(serializers.Serializer):
     image_count = serializers.IntegerField()
     video_count = serializers.IntegerField()
     doc_count = serializers.IntegerField()
+    page_size = serializers.IntegerField()
+    next_cursor = serializers.CharField(allow_null=True)
+    journal_counts = serializers.DictField(child=serializers.IntegerField())
 
     def create(self, validated_data):
         pass
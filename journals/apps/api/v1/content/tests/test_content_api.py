@@ -1,23 +1,29 @@
 """ Test Cases for /api/v1/content/ APIs """
 import datetime
 import json
+import uuid
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from wagtail.wagtailcore.models import Site
+from wagtail.wagtailcore.rich_text import RichText
 
 from journals.apps.core.tests.factories import (
     JournalFactory,
     JournalAccessFactory,
     OrganizationFactory,
     UserFactory,
-    USER_PASSWORD
+    USER_PASSWORD,
+    VideoFactory,
 )
 from journals.apps.core.tests.utils import (
     TEST_JOURNAL_STRUCTURE,
     create_journal_about_page_factory,
     is_nested_json_equivalent
 )
+from journals.apps.journals.blocks import RICH_TEXT_BLOCK_TYPE, VIDEO_BLOCK_TYPE, JournalRichTextBlock
+from journals.apps.journals.models import JournalAccess
 
 
 class TestContentPagesAPI(TestCase):
@@ -25,6 +31,7 @@ class TestContentPagesAPI(TestCase):
 
     def setUp(self):
         super(TestContentPagesAPI, self).setUp()
+        cache.clear()
 
         self.user = UserFactory()
         self.test_about_page_slug = 'journal-about-page-slug'
@@ -100,3 +107,84 @@ class TestContentPagesAPI(TestCase):
 
         page_json = response_json['items'][0]
         self.assertTrue(is_nested_json_equivalent(page_json, self.journal_test_data))
+
+    def test_get_journal_pages_with_bread_crumbs(self):
+        """ Get journal pages with their bread crumbs """
+        response = self.client.get(self.path, {
+            'type': 'journals.JournalPage',
+            'fields': 'bread_crumbs',
+            'slug': 'test_page_1_a_ii',
+        })
+
+        self.assertEqual(response.status_code, 200)
+
+        response_json = json.loads(response.content.decode('utf-8'))
+        bread_crumbs = [crumb['title'] for crumb in response_json['items'][0]['bread_crumbs']]
+        self.assertEqual(bread_crumbs, ['test_page_1', 'test_page_1_a'])
+
+    def test_get_journal_page_etag(self):
+        """ Page detail responses carry an ETag and repeat requests get a 304 """
+        page = self.journal_about_page.get_children().first()
+        path = reverse('content:pages:detail', args=(page.id,))
+
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # publishing a page in the journal changes the ETag
+        self.journal_about_page.invalidate_structure()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # access is still checked before a cached response is returned
+        self.journal_access.revoked = True
+        self.journal_access.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_journal_page_etag_follows_used_objects(self):
+        """ The ETag of a page changes when the videos and pages it uses change """
+        page = self.journal_about_page.get_children().first().specific
+        linked_page = page.get_next_sibling()
+        video = VideoFactory(block_id=uuid.uuid4())
+        page.body = [
+            (VIDEO_BLOCK_TYPE, {'video': video, 'title': ''}),
+            (RICH_TEXT_BLOCK_TYPE, RichText('<a linktype="page" id="{}">link</a>'.format(linked_page.id))),
+        ]
+        page.save()
+        path = reverse('content:pages:detail', args=(page.id,))
+
+        etag = self.client.get(path)['ETag']
+        video.display_name = 'renamed video'
+        video.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['body'][0]['value']['title'], 'renamed video')
+
+        etag = response['ETag']
+        JournalRichTextBlock.invalidate_expanded_html('page', [linked_page.id])
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_accessible_journals_cache_invalidated(self):
+        """ Cached journal access of the user follows grants and revokes """
+        page = self.journal_about_page.get_children().first()
+        path = reverse('content:pages:detail', args=(page.id,))
+
+        self.journal_access.delete()
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 404)
+
+        JournalAccess.bulk_create_journal_access([self.user.username], self.journal)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+
+        JournalAccess.objects.get(user=self.user).delete()
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 404)
@@ -1,10 +1,20 @@
 """
 Overridden Wagtail API endpoints
 """
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 from wagtail.api.v2.endpoints import PagesAPIEndpoint
 
 from journals.apps.api.filters import PageAuthorizationFilter
+from journals.apps.journals.blocks import JournalRichTextBlock
+from journals.apps.journals.journal_page_helper import JournalPageMixin
+from journals.apps.journals.models import JournalAboutPage, JournalPage
+from journals.apps.journals.utils import get_cache_key
+
+PAGE_RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24  # keyed by live revision, so it can live for a day
 
 
 class JournalPagesAPIEndpoint(PagesAPIEndpoint):
@@ -17,3 +27,64 @@ class JournalPagesAPIEndpoint(PagesAPIEndpoint):
 
     permission_classes = (AllowAny, )
     filter_backends = [PageAuthorizationFilter] + PagesAPIEndpoint.filter_backends
+
+    def paginate_queryset(self, queryset):
+        """
+        Resolve the bread crumbs of all JournalPages in the listing at once
+        instead of one ancestors query per page
+        """
+        pages = super(JournalPagesAPIEndpoint, self).paginate_queryset(queryset)
+
+        fields = self.request.GET.get('fields', '')
+        if 'bread_crumbs' in fields or '*' in fields:
+            pages = list(pages)
+            JournalPage.prefetch_bread_crumbs([page for page in pages if isinstance(page, JournalPage)])
+
+        return pages
+
+    def detail_view(self, request, pk):
+        """
+        Serve the page from the response cache, or a 304 if the client already has it.
+        get_object applies the filter backends, so the PageAuthorizationFilter
+        access check always runs before a cached response is returned.
+        """
+        instance = self.get_object()
+
+        cache_key = self.get_response_cache_key(request, instance)
+        etag = quote_etag(cache_key)
+
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data = cache.get(cache_key)
+            if data is None:
+                data = self.get_serializer(instance).data
+                cache.set(cache_key, data, PAGE_RESPONSE_CACHE_TIMEOUT)
+            response = Response(data)
+
+        response['ETag'] = etag
+        return response
+
+    def get_response_cache_key(self, request, page):
+        """
+        The response of a page only changes when it is published, when another page of its journal is
+        published (structure, bread crumbs and navigation), or when the pages, documents, images and videos
+        it uses change, so it is keyed by the page's live revision, the journal's published stamp and the
+        link stamps of what it uses. The absolute url covers the requested fields and the host used to
+        build absolute urls in the page body.
+        """
+        if isinstance(page, JournalAboutPage):
+            journal_about_id = page.id
+        else:
+            journal_about_id = getattr(page, 'journal_about_page_id', None)
+        link_ids = page.get_link_ids() if isinstance(page, JournalPageMixin) else None
+
+        return get_cache_key(
+            resource='page_response',
+            page_id=page.id,
+            live_revision_id=page.live_revision_id,
+            published=JournalAboutPage.get_published_stamp(journal_about_id) if journal_about_id else None,
+            links=JournalRichTextBlock.get_links_stamp(link_ids) if link_ids is not None else None,
+            url=request.build_absolute_uri(),
+        )
@@ -6,6 +6,13 @@ from journals.apps.journals.models import JournalPage, JournalDocument, JournalI
 from journals.apps.journals.blocks import PDF_BLOCK_TYPE, VIDEO_BLOCK_TYPE, IMAGE_BLOCK_TYPE, RICH_TEXT_BLOCK_TYPE
 from journals.apps.journals.templatetags.wagtail_tags import get_block_fragment_identifier
 
+# component types and the JournalPage field of the pages they are used in
+COMPONENT_PAGE_FIELDS = (
+    (JournalDocument, 'documents'),
+    (JournalImage, 'images'),
+    (Video, 'videos'),
+)
+
 
 class SearchResults(object):
     """
@@ -25,15 +32,16 @@ class SearchHit(object):
     """
     This class encapsulates a SearchHit object
     """
-    def __init__(self, journal_page, component=None):
+    def __init__(self, journal_page, about_page, component=None):
         """
         Args:
             journal_page: JournalPage that contains the search hit
+            about_page: JournalAboutPage of the journal journal_page belongs to
             component: Specific object type that contains the hit (JournalImage, JournalDocument, Video)
             If none then hit is text found in the base JournalPage itself
         """
 
-        self._set_page_info(journal_page)
+        self._set_page_info(journal_page, about_page)
 
         # Setup block information
         if component:
@@ -41,17 +49,18 @@ class SearchHit(object):
         else:
             self._set_type_info(journal_page)
 
-    def _set_page_info(self, journal_page):
+    def _set_page_info(self, journal_page, about_page):
         """
         Set information about Page that hit was found on
         """
-        about_page = journal_page.get_journal_about_page()
         self.journal_about_page_id = about_page.id
-        self.journal_id = about_page.journal.id
+        self.journal_id = about_page.journal_id
         self.journal_name = about_page.title
         self.page_id = journal_page.id
         self.page_title = journal_page.title
-        self.breadcrumbs = journal_page.get_bread_crumbs(title_only=True)
+        self.journal_page = journal_page
+        # resolved for all hits at once by build_hit_list
+        self.breadcrumbs = []
 
     def _set_type_info(self, component):
         """
@@ -79,11 +88,75 @@ class SearchHit(object):
         if not self.block_type == RICH_TEXT_BLOCK_TYPE:
             self.span_id = get_block_fragment_identifier(self.block_id, self.block_type)
 
-    def __lt__(self, other):
+    @classmethod
+    def build_hit_list(cls, search_results, journal_pages, about_pages):
+        """
+        Build the SearchHits of the search results in a fixed number of queries, whatever the number of hits
+        Args:
+            search_results: JournalPages and components (JournalDocument, JournalImage, Video) found, in hit order
+            journal_pages: queryset of the JournalPages hits can be shown on
+            about_pages: the JournalAboutPages that were searched
+        Returns:
+            list of SearchHit objects, a component used in several pages gives a hit for each of them
+        """
+        journal_pages = journal_pages.filter(journal_about_page__in=about_pages)
+
+        # the pages each component hit is used in, with a query per component type
+        component_page_ids = {}
+        for component_class, column in COMPONENT_PAGE_FIELDS:
+            component_ids = [result.id for result in search_results if isinstance(result, component_class)]
+            if component_ids:
+                page_ids = journal_pages.filter(
+                    **{column + '__in': component_ids}
+                ).order_by('path').values_list(column, 'id')
+                for component_id, page_id in page_ids:
+                    component_page_ids.setdefault((component_class, component_id), []).append(page_id)
+
+        all_page_ids = set(page_id for page_ids in component_page_ids.values() for page_id in page_ids)
+        component_pages = journal_pages.filter(
+            id__in=all_page_ids
+        ).only(
+            'id', 'title', 'url_path', 'path', 'depth'
+        ).in_bulk() if all_page_ids else {}
+
+        about_pages_by_path = {about_page.path: about_page for about_page in about_pages}
+
+        hit_list = []
+        for search_result in search_results:
+            if isinstance(search_result, JournalPage):
+                about_page = cls._get_about_page(search_result, about_pages_by_path)
+                # the index may not have caught up yet with a page moved out of the journals searched
+                if about_page:
+                    hit_list.append(cls(search_result, about_page))
+                continue
+
+            for page_id in component_page_ids.get((type(search_result), search_result.id), []):
+                page = component_pages[page_id]
+                about_page = cls._get_about_page(page, about_pages_by_path)
+                # the journal_about_page of a moved page may not have been updated yet
+                if about_page:
+                    hit_list.append(cls(page, about_page, component=search_result))
+
+        bread_crumbs = JournalPage.get_bread_crumbs_for_pages(
+            [hit.journal_page for hit in hit_list],
+            title_only=True
+        )
+        for hit in hit_list:
+            hit.breadcrumbs = bread_crumbs[hit.page_id]
+
+        return hit_list
+
+    @staticmethod
+    def _get_about_page(page, about_pages_by_path):
         """
-        comparator needed for sorting via bisect function
+        Return the about page among about_pages_by_path (path to JournalAboutPage) that is an
+        ancestor of page, or None when page is not in any of those journals
         """
-        return self.score < other
+        for depth in range(page.depth - 1, 0, -1):
+            about_page = about_pages_by_path.get(page.path[:page.steplen * depth])
+            if about_page:
+                return about_page
+        return None
 
 
 class SearchMetaData(object):
@@ -96,3 +169,8 @@ class SearchMetaData(object):
         self.image_count = 0
         self.video_count = 0
         self.doc_count = 0
+        self.page_size = 0
+        # opaque token to pass as the cursor param for the next page, None on the last page
+        self.next_cursor = None
+        # journal id to the number of matches of all types in the journal
+        self.journal_counts = {}
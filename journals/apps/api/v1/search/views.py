@@ -1,6 +1,7 @@
 """ API for searching content of Journals
     Usage:
         /api/v1/search/<journal_id>/?query=<query_string>&operator=<operator>&type=<type>
+            &page_size=<page_size>&cursor=<cursor>
     Args:
         <journal_id>: The id for Journal object to search in. If omitted will search
         all of the published Journals the requested user has access to on the given Site
@@ -13,16 +14,39 @@
                 'images' - search for images only
                 'documents' - search in documents only
                 'videos' - search in videos only
+        <page_size>: number of hits to return, defaults to 20 and is capped at 100
+        <cursor>: the next_cursor of the previous response to get the following page of hits
     Returns:
-        List of SearchResuls objects (see SearchResultsSerializer) sorted by hit score
+        List of SearchResuls objects (see SearchResultsSerializer) sorted by hit score,
+        search_metadata.next_cursor is null on the last page and search_metadata.journal_counts
+        maps the journal ids to their number of matches
+
+API for suggest as you type
+    Usage:
+        /api/v1/search/suggest/?query=<prefix>
+        /api/v1/search/<journal_id>/suggest/?query=<prefix>
+    Args:
+        <prefix>: The start of the text typed, should be url encoded
+    Returns:
+        {"suggestions": [{"text": <page title, sub title or author, image caption or video name>,
+                          "type": "page"|"image"|"video", "id": <id of the page, image or video>}]}
+        best first, from the content of the Journals searched by the search API
 """
-import bisect
+import base64
+import binascii
+import heapq
+import itertools
+import json
 import logging
+import numbers
+from collections import Counter
 
+from django.core.cache import cache
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from wagtail.wagtailsearch.models import Query
+from wagtail.wagtailsearch.backends import get_search_backend
 
 from journals.apps.journals.models import (
     JournalAboutPage,
@@ -34,47 +58,106 @@ from journals.apps.journals.models import (
 )
 from journals.apps.api.serializers import SearchResultsSerializer
 from journals.apps.api.v1.search.models import SearchResults, SearchHit, SearchMetaData
+from journals.apps.journals.utils import get_cache_key
+from journals.apps.search.backend import RELEVANCE_SORT
+from journals.apps.search.query_hits import query_hits
 
 logger = logging.getLogger(__name__)
 
 PARAM_QUERY = 'query'
 PARAM_OPERATOR = 'operator'
 PARAM_TYPE = 'type'
+PARAM_PAGE_SIZE = 'page_size'
+PARAM_CURSOR = 'cursor'
+TYPE_TEXT = 'text'
 TYPE_IMAGE = 'images'
 TYPE_DOCUMENT = 'documents'
 TYPE_VIDEO = 'videos'
 TYPE_ALL = 'all'
 OPERATOR_OR = 'or'
 OPERATOR_AND = 'and'
+COMPONENT_SEARCH_TYPES = (
+    # (type param, component model, SearchMetaData count field)
+    (TYPE_DOCUMENT, JournalDocument, 'doc_count'),
+    (TYPE_IMAGE, JournalImage, 'image_count'),
+    (TYPE_VIDEO, Video, 'video_count'),
+)
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+INVALID_CURSOR_MESSAGE = 'Invalid cursor'
+JOURNAL_COUNTS_AGGREGATION = 'journals'
+SUGGEST_MODELS = {
+    # model to the suggestion type returned
+    JournalPage: 'page',
+    JournalImage: 'image',
+    Video: 'video',
+}
+SUGGEST_SIZE = 10
+MAX_SUGGEST_PREFIX_LENGTH = 100
+SEARCH_RESULTS_CACHE_TIMEOUT = 60 * 60  # also expires when content of the journals searched changes
 
 
 class SearchView(APIView):
     """
     View to return Journal SearchResults via RestAPI
     """
-    # TODO: add pagination WL-1719
 
     def get(self, request, journal_id=None):
         """
         Get search results for specified journal or all journals
         for current site
         """
-        search_results = self._search(request, journal_id)
-        serializer = SearchResultsSerializer(search_results)
-        return Response(serializer.data)
+        # Get Journals user has access to
+        about_pages = self._get_journals_for_user(request, journal_id)
+        search_query = request.GET.get(PARAM_QUERY, None)
+
+        if not about_pages or not search_query:
+            return Response(SearchResultsSerializer(self._search(request, about_pages)).data)
+
+        cache_key = self._get_results_cache_key(request, about_pages)
+        results_data = cache.get(cache_key)
+        if results_data is None:
+            results_data = SearchResultsSerializer(self._search(request, about_pages)).data
+            cache.set(cache_key, results_data, SEARCH_RESULTS_CACHE_TIMEOUT)
+
+        query_hits.add_hit(search_query)
+
+        return Response(results_data)
+
+    def _get_results_cache_key(self, request, about_pages):
+        """
+        Cache key of the results of the search in request. It includes the generations
+        of the journals searched, so the results expire when any of them changes.
+        """
+        journal_about_ids = sorted(about_page.id for about_page in about_pages)
+        generations = JournalAboutPage.get_search_generations(journal_about_ids)
+
+        return get_cache_key(
+            resource='search_results',
+            query=' '.join(request.GET[PARAM_QUERY].lower().split()),
+            operator=request.GET.get(PARAM_OPERATOR, OPERATOR_OR),
+            type=request.GET.get(PARAM_TYPE, TYPE_ALL),
+            page_size=self._get_page_size(request),
+            cursor=request.GET.get(PARAM_CURSOR, ''),
+            journal_about_ids=journal_about_ids,
+            generations=[generations[journal_about_id] for journal_about_id in journal_about_ids],
+        )
 
-    def _search(self, request, journal_id=None):
+    def _search(self, request, about_pages):
         '''
         handler for search requests
+        Args:
+            request: Request object
+            about_pages: JournalAboutPage objects of the journals to search
         '''
         search_query = request.GET.get(PARAM_QUERY, None)
         search_operator = request.GET.get(PARAM_OPERATOR, OPERATOR_OR)
         search_filter = request.GET.get(PARAM_TYPE, TYPE_ALL)
+        page_size = self._get_page_size(request)
+        cursor = self._decode_cursor(request.GET.get(PARAM_CURSOR))
         hit_list = []
         search_meta = SearchMetaData()
-
-        # Get Journals user has access to
-        about_pages = self._get_journals_for_user(request, journal_id)
+        search_meta.page_size = page_size
 
         if not about_pages:
             return SearchResults(search_meta, hit_list)
@@ -83,139 +166,152 @@ class SearchView(APIView):
 
             clean_query = search_query  # TODO: do we need to do any cleansing of querystring?
 
-            for about_page in about_pages:
-
-                #  Only include pages beneath our root page that are live and public
-                base_page_query = JournalPage.objects.live().public().descendant_of(about_page)
-
-                if search_filter == TYPE_ALL:
-                    # Search pages which will yield hits for text/HTML/RawHTML
-                    page_search_results = base_page_query.search(
+            #  Only include pages of our journals that are live and public
+            base_page_query = JournalPage.objects.live().public()
+            journal_ids = [about_page.journal_id for about_page in about_pages]
+
+            # lazy search results of every type, evaluated together below
+            searches = []
+
+            if search_filter == TYPE_ALL:
+                # Search pages which will yield hits for text/HTML/RawHTML
+                page_search_results = base_page_query.search(
+                    clean_query,
+                    operator=search_operator
+                ).annotate_score(
+                    'score'
+                ).filter_terms(
+                    'journal_ids', journal_ids
+                )
+                searches.append((TYPE_TEXT, 'text_count', page_search_results))
+
+            for component_type, component_class, meta_count_field in COMPONENT_SEARCH_TYPES:
+                if search_filter == TYPE_ALL or search_filter == component_type:
+                    # Components are indexed with the journals of the live and public pages using them
+                    component_search_results = component_class.objects.search(
                         clean_query,
                         operator=search_operator
                     ).annotate_score(
                         'score'
+                    ).filter_terms(
+                        'journal_ids', journal_ids
                     )
+                    searches.append((component_type, meta_count_field, component_search_results))
+
+            # Each type only needs its next page_size hits after the ones already returned
+            # for the merged page to be complete
+            paged_searches = []
+            for search_type, meta_count_field, search_results in searches:
+                if search_type in cursor:
+                    search_results = search_results.search_after(cursor[search_type])
+                # only the journals searched are counted, not the others sharing the components found
+                search_results = search_results.aggregate_terms(
+                    JOURNAL_COUNTS_AGGREGATION, 'journal_ids', journal_ids
+                )
+                paged_searches.append((search_type, meta_count_field, search_results[:page_size]))
+
+            # a single round trip to elasticsearch for all types in all journals,
+            # the totals and per journal counts come from the same responses
+            get_search_backend().multi_search([search_results for _, _, search_results in paged_searches])
+
+            journal_counts = Counter()
+            for _, meta_count_field, search_results in paged_searches:
+                setattr(search_meta, meta_count_field, search_results.hits_total)
+                search_meta.total_count += search_results.hits_total
+                journal_counts.update(search_results.term_counts[JOURNAL_COUNTS_AGGREGATION])
+            # journal ids are indexed as keywords
+            search_meta.journal_counts = {int(journal_id): count for journal_id, count in journal_counts.items()}
+
+            # the cursor moves past the hits elasticsearch returned, including those of objects
+            # missing from the database, so stale hits are skipped instead of returned again
+            results_by_pk = {
+                search_type: {str(result.pk): result for result in search_results}
+                for search_type, _, search_results in paged_searches
+            }
+            next_cursor = dict(cursor)
+            merged_counts = Counter()
+            matches = []
+            for search_type, hit in self._merge_by_score(paged_searches, page_size):
+                next_cursor[search_type] = hit['sort']
+                merged_counts[search_type] += 1
+                result = results_by_pk[search_type].get(hit['pk'])
+                if result is not None:
+                    matches.append(result)
+
+            # a type has more hits if some of those returned were left out of this page, or if it
+            # returned a full page
+            has_more = any(
+                merged_counts[search_type] < len(search_results.raw_hits) or
+                len(search_results.raw_hits) == page_size
+                for search_type, _, search_results in paged_searches
+            )
+            if has_more:
+                search_meta.next_cursor = self._encode_cursor(next_cursor)
 
-                    self._add_to_hit_list(hit_list, page_search_results, journal_page_ids=None, base_page=True)
-                    search_meta.text_count += page_search_results.count()
-
-                if search_filter == TYPE_ALL or search_filter == TYPE_DOCUMENT:
-                    journal_page_ids, doc_search_results = self._filetype_search(
-                        base_page_query,
-                        clean_query,
-                        search_operator,
-                        JournalDocument
-                    )
-
-                    self._add_to_hit_list(hit_list, doc_search_results, journal_page_ids, base_page=False)
-                    search_meta.doc_count += doc_search_results.count()
-
-                if search_filter == TYPE_ALL or search_filter == TYPE_IMAGE:
-                    # Get the Images that are used in JournalPages beneath journal_root_page
-                    journal_page_ids, image_search_results = self._filetype_search(
-                        base_page_query,
-                        clean_query,
-                        search_operator,
-                        JournalImage
-                    )
-                    self._add_to_hit_list(hit_list, image_search_results, journal_page_ids, base_page=False)
-                    search_meta.image_count += image_search_results.count()
-
-                if search_filter == TYPE_ALL or search_filter == TYPE_VIDEO:
-                    # Get the list of Video id's that are used in JournalPages beneath journal_root_page
-                    journal_page_ids, video_search_results = self._filetype_search(
-                        base_page_query,
-                        clean_query,
-                        search_operator,
-                        Video
-                    )
-                    self._add_to_hit_list(hit_list, video_search_results, journal_page_ids, base_page=False)
-                    search_meta.video_count += video_search_results.count()
-
-                query = Query.get(clean_query)
-                query.add_hit()
-
-            search_meta.total_count = len(hit_list)
+            hit_list = SearchHit.build_hit_list(matches, base_page_query, about_pages)
 
-        # return the list iterator in descending order with highest hit score first
-        return SearchResults(search_meta, reversed(hit_list))
+        # hits are in descending order with highest hit score first
+        return SearchResults(search_meta, hit_list)
 
-    def _filetype_search(self, base_page_query, query_string, search_operator, type_class):
+    @staticmethod
+    def _merge_by_score(searches, limit):
         """
-        Search
+        Lazily merge the elasticsearch hits of the searches, each already in descending score order,
+        into the top limit (search type, hit) pairs with the highest score first. Ties keep the order
+        of the searches.
         """
-        if type_class == JournalDocument:
-            column = 'documents'
-        elif type_class == JournalImage:
-            column = 'images'
-        elif type_class == Video:
-            column = 'videos'
-        else:
-            return None
-
-        id_clause = column + '__id'
-        field = id_clause + '__isnull'
-
-        # Get the list of <type_class> id's that are used in JournalPages beneath journal_root_page
-        # i.e.
-        # id_list = base_page_query.only('documents').filter(documents__id__isnull=False).distinct().
-        # values_list('documents__id', 'id')
-
-        id_list = base_page_query.only(
-            '{column}'.format(column=column)
-        ).filter(
-            **{field: False}
-        ).distinct().values_list(
-            '{id_clause}'.format(id_clause=id_clause), 'id'
-        )
+        def _stream(search_type, search_results):
+            for hit in search_results.raw_hits:
+                yield search_type, hit
 
-        # list of component id's
-        component_id_list = [item[0] for item in id_list]
-
-        # Now search only objects with id's in the list
-        results = type_class.objects.filter(
-            id__in=component_id_list
-        ).search(
-            query_string,
-            operator=search_operator
-        ).annotate_score(
-            'score'
-        )
+        streams = [_stream(search_type, search_results) for search_type, _, search_results in searches]
+        merged = heapq.merge(*streams, key=lambda item: item[1]['score'] or 0, reverse=True)
+        return itertools.islice(merged, limit)
 
-        journal_page_id_list = []
+    @staticmethod
+    def _get_page_size(request):
+        """
+        Number of matched items (pages, documents, images, videos) to return, invalid values fall back
+        to the default like DRF's page number pagination does
+        """
+        try:
+            page_size = int(request.GET.get(PARAM_PAGE_SIZE, DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return DEFAULT_PAGE_SIZE
 
-        if results.count():
-            # list of journal page ids
-            journal_page_id_list = [item[1] for item in id_list]
+        if page_size <= 0:
+            return DEFAULT_PAGE_SIZE
+        return min(page_size, MAX_PAGE_SIZE)
 
-        return journal_page_id_list, results
+    @staticmethod
+    def _encode_cursor(cursor):
+        """
+        Encode the cursor, a dict mapping each search type to the elasticsearch sort values of the last
+        of its hits returned so far
+        """
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
 
-    def _add_to_hit_list(self, results, search_results, journal_page_ids, base_page=True):
+    @staticmethod
+    def _decode_cursor(encoded_cursor):
         """
-        Add search_results to result list in sorted order by 'score'
-        Args:
-            results: list of SearchResults objects sorted by score (ascending)
-            search_results: QuerySet representing the search results
-            journal_page_ids: list of page id's that contain component hits
-            base_page: True if search_results are for journal_page
-        """
-        for result in search_results:
-            score = getattr(result, 'score', 0)
-            position = bisect.bisect_left(results, score)
-            if base_page:
-                results.insert(position, SearchHit(journal_page=result, component=None))
-            else:
-                # find the specific JournalPages (from filtered list) where the Component
-                # was found
-                journal_page_list = result.journalpage_set.filter(
-                    id__in=journal_page_ids
-                ).only(
-                    'id', 'title', 'url_path'
-                ).live().distinct()
-
-                for page in journal_page_list:
-                    results.insert(position, SearchHit(journal_page=page, component=result))
+        Decode a cursor encoded by _encode_cursor, checking each search type maps to the score and pk
+        sort values of RELEVANCE_SORT so elasticsearch is never sent malformed search_after values
+        """
+        if not encoded_cursor:
+            return {}
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded_cursor.encode('ascii')).decode('utf-8'))
+            for sort_values in cursor.values():
+                if not isinstance(sort_values, list) or len(sort_values) != len(RELEVANCE_SORT):
+                    raise ValueError
+                score, pk = sort_values
+                if isinstance(score, bool) or not isinstance(score, numbers.Number) or not isinstance(pk, str):
+                    raise ValueError
+        except (TypeError, ValueError, AttributeError, UnicodeError, binascii.Error):
+            raise ValidationError(INVALID_CURSOR_MESSAGE)
+
+        return cursor
 
     def _get_journals_for_user(self, request, journal_id=None):
         """
@@ -240,3 +336,42 @@ class SearchView(APIView):
             )
 
         return about_pages
+
+
+class SuggestView(APIView):
+    """
+    View to return search suggestions, completions of the titles of the content
+    of the Journals the user has access to, via RestAPI
+    """
+
+    def get(self, request, journal_id=None):
+        """
+        Get suggestions for the query prefix in specified journal or all journals
+        for current site
+        """
+        prefix = request.GET.get(PARAM_QUERY, '').strip()[:MAX_SUGGEST_PREFIX_LENGTH]
+        suggestions = []
+
+        journal_ids = self._get_journal_ids_for_user(request, journal_id) if prefix else []
+        if journal_ids:
+            for text, model, pk in get_search_backend().suggest(SUGGEST_MODELS, prefix, journal_ids, SUGGEST_SIZE):
+                suggestions.append({'text': text, 'type': SUGGEST_MODELS[model], 'id': pk})
+
+        return Response({'suggestions': suggestions})
+
+    @staticmethod
+    def _get_journal_ids_for_user(request, journal_id=None):
+        """
+        Get the ids of the journals the user has access to among the live journals
+        of the requested site, the journals SearchView searches
+        """
+        journal_id_list = JournalAccess.get_user_accessible_journal_ids(request.user)
+        if journal_id:
+            journal_id_list = [int(journal_id)] if int(journal_id) in journal_id_list else []
+
+        if not journal_id_list:
+            return []
+
+        return list(request.site.root_page.get_children().live().filter(
+            journalaboutpage__journal__id__in=journal_id_list
+        ).values_list('journalaboutpage__journal_id', flat=True))
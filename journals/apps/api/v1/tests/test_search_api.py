@@ -2,16 +2,21 @@
 import datetime
 import json
 import uuid
+from types import SimpleNamespace
+from unittest import mock
 
 from django.core import management
+from django.core.cache import cache
 from django.db.models import Q
 from django.template.defaultfilters import striptags
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from django.urls import reverse
 from wagtail.wagtailcore.models import Site
 
+from journals.apps.api.v1.search.models import SearchHit
 from journals.apps.api.v1.search.views import TYPE_ALL, PARAM_TYPE, PARAM_QUERY, PARAM_OPERATOR, OPERATOR_AND, \
-    OPERATOR_OR, TYPE_IMAGE, TYPE_DOCUMENT, TYPE_VIDEO
+    OPERATOR_OR, TYPE_IMAGE, TYPE_DOCUMENT, TYPE_VIDEO, DEFAULT_PAGE_SIZE, JOURNAL_COUNTS_AGGREGATION, \
+    MAX_PAGE_SIZE, SearchView
 from journals.apps.core.tests.factories import (
     JournalFactory,
     JournalAccessFactory,
@@ -20,8 +25,9 @@ from journals.apps.core.tests.factories import (
     USER_PASSWORD, RAW_HTML_BLOCK_DATA)
 from journals.apps.core.tests.utils import (
     TEST_JOURNAL_STRUCTURE, create_journal_about_page_factory)
-from journals.apps.journals.blocks import RICH_TEXT_BLOCK_TYPE
-from journals.apps.journals.models import JournalImage, JournalDocument, Video, JournalPage
+from journals.apps.journals.blocks import PDF_BLOCK_TYPE, RICH_TEXT_BLOCK_TYPE
+from journals.apps.journals.models import JournalAboutPage, JournalImage, JournalDocument, Video, JournalPage
+from journals.apps.search.query_hits import query_hits
 
 
 class TestSearchAPI(TestCase):
@@ -59,6 +65,11 @@ class TestSearchAPI(TestCase):
 
     def setUp(self):
         super(TestSearchAPI, self).setUp()
+        cache.clear()
+        # the hits buffered by the view would be flushed once the test database is gone
+        add_hit_patcher = mock.patch.object(query_hits, 'add_hit')
+        add_hit_patcher.start()
+        self.addCleanup(add_hit_patcher.stop)
         self.client.login(username=self.user.username, password=USER_PASSWORD)
 
     @staticmethod
@@ -76,6 +87,7 @@ class TestSearchAPI(TestCase):
         self.assertEqual(response_json['meta']['image_count'], image_count, "Incorrect number of images")
         self.assertEqual(response_json['meta']['video_count'], video_count, "Incorrect number of videos")
         self.assertEqual(response_json['meta']['total_count'], total, "Incorrect total results")
+        self.assertEqual(sum(response_json['meta']['journal_counts'].values()), total, "Incorrect journal counts")
 
     def _search_across_multiple_journals(self, query_string):
         """ search querystring across multi journals and make assertions"""
@@ -272,3 +284,285 @@ class TestSearchAPI(TestCase):
         response = self.client.get(self.multi_journal_search_path)
         self.assertEqual(response.status_code, 200)
         self._make_assertions(response, 0, 0, 0, 0)
+
+    def test_suggest(self):
+        """ test suggestions complete the titles of the journal content the user has access to """
+        response = self.client.get(reverse('api:v1:multi_journal_suggest'), {PARAM_QUERY: 'test_page_1'})
+        self.assertEqual(response.status_code, 200)
+        suggestions = json.loads(response.content.decode('utf-8'))['suggestions']
+        self.assertTrue(suggestions)
+        for suggestion in suggestions:
+            self.assertTrue(suggestion['text'].startswith('test_page_1'))
+            self.assertEqual(suggestion['type'], 'page')
+            self.assertTrue(JournalPage.objects.filter(
+                id=suggestion['id'], journal_about_page=self.journal_about_page
+            ).exists())
+
+        self.client.logout()
+        self.client.login(username=UserFactory().username, password=USER_PASSWORD)
+        response = self.client.get(reverse('api:v1:multi_journal_suggest'), {PARAM_QUERY: 'test_page_1'})
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['suggestions'], [])
+
+    def test_search_results_cached(self):
+        """ test repeated searches are served from the cache until content of the journal changes """
+        params = {PARAM_QUERY: self.common_query_string, PARAM_TYPE: TYPE_ALL}
+        response = self.client.get(self.multi_journal_search_path, params)
+
+        empty_responses = {'responses': [
+            {'hits': {'total': 0, 'hits': []}, 'aggregations': {JOURNAL_COUNTS_AGGREGATION: {'buckets': []}}}
+        ] * 4}
+        with mock.patch('elasticsearch.Elasticsearch.msearch', return_value=empty_responses) as msearch:
+            # normalized queries share the cache entry
+            params[PARAM_QUERY] = '  {} '.format(self.common_query_string.upper())
+            cached_response = self.client.get(self.multi_journal_search_path, params)
+            self.assertFalse(msearch.called)
+            self.assertEqual(json.loads(cached_response.content.decode('utf-8')),
+                             json.loads(response.content.decode('utf-8')))
+
+            JournalAboutPage.invalidate_search_results([self.journal_about_page.id])
+            self.client.get(self.multi_journal_search_path, params)
+            self.assertTrue(msearch.called)
+
+
+class TestMergeByScore(SimpleTestCase):
+    """ Test Cases for merging the per type search results """
+
+    def test_merge_by_score(self):
+        def results(*scores):
+            return SimpleNamespace(raw_hits=[{'pk': str(pk), 'score': score} for pk, score in enumerate(scores)])
+
+        searches = [
+            ('text', 'text_count', results(9, 5, 5, 1)),
+            (TYPE_IMAGE, 'image_count', results(7, 5)),
+            (TYPE_VIDEO, 'video_count', results()),
+        ]
+        merged = list(SearchView._merge_by_score(searches, 4))  # pylint: disable=protected-access
+
+        self.assertEqual([hit['score'] for _, hit in merged], [9, 7, 5, 5])
+        self.assertEqual([search_type for search_type, _ in merged], ['text', TYPE_IMAGE, 'text', 'text'])
+
+
+class MockedSearchTestCase(TestCase):
+    """ Base of the test cases searching journals the user has access to, with elasticsearch mocked """
+
+    def setUp(self):
+        super(MockedSearchTestCase, self).setUp()
+        cache.clear()
+        # the hits buffered by the view would be flushed once the test database is gone
+        add_hit_patcher = mock.patch.object(query_hits, 'add_hit')
+        add_hit_patcher.start()
+        self.addCleanup(add_hit_patcher.stop)
+        self.site = Site.objects.first()
+        self.user = UserFactory()
+        self.client.login(username=self.user.username, password=USER_PASSWORD)
+
+    def _create_journal_about_page(self, about_page_slug):
+        """ Create a journal with the test structure that the user has access to """
+        journal = JournalFactory(organization=OrganizationFactory(site=self.site), uuid=uuid.uuid4())
+        JournalAccessFactory(journal=journal, user=self.user, uuid=uuid.uuid4(),
+                             expiration_date=datetime.date.today() + datetime.timedelta(days=1))
+        return create_journal_about_page_factory(
+            journal=journal,
+            journal_structure=TEST_JOURNAL_STRUCTURE,
+            root_page=self.site.root_page,
+            about_page_slug=about_page_slug
+        )
+
+    @staticmethod
+    def _hit(pk, score):
+        """ An elasticsearch hit of the object with pk, sorted by relevance """
+        return {'_score': score, 'fields': {'pk': [pk]}, 'sort': [score, str(pk)]}
+
+    @staticmethod
+    def _response(hits=(), total=None, buckets=()):
+        """ The elasticsearch response of one search of an msearch request """
+        return {
+            'hits': {'total': len(hits) if total is None else total, 'hits': list(hits)},
+            'aggregations': {JOURNAL_COUNTS_AGGREGATION: {'buckets': list(buckets)}},
+        }
+
+    def _get(self, path, params, get_responses):
+        """
+        Request path with the msearch request answered by get_responses, called with the bodies of its searches
+        Returns: the response and the bodies of the searches sent to elasticsearch
+        """
+        bodies = []
+
+        def msearch(body):
+            """ Record the bodies of the searches of the msearch request and answer them """
+            searches = body[1::2]
+            bodies.extend(searches)
+            return {'responses': get_responses(searches)}
+
+        with mock.patch('elasticsearch.Elasticsearch.msearch', side_effect=msearch):
+            response = self.client.get(path, params)
+        return response, bodies
+
+
+class TestSearchPaging(MockedSearchTestCase):
+    """ Test Cases for paging through search results with a cursor, elasticsearch mocked """
+
+    def setUp(self):
+        super(TestSearchPaging, self).setUp()
+        about_page = self._create_journal_about_page('search-paging-about-page')
+        self.pages = list(JournalPage.objects.live().filter(journal_about_page=about_page).order_by('id'))
+        self.search_path = reverse('api:v1:journal_search', args=(about_page.journal_id,))
+
+    def _search(self, page_hits, **params):
+        """ Search pages with elasticsearch returning page_hits for pages and nothing for the other types """
+        params[PARAM_QUERY] = 'query'
+        return self._get(self.search_path, params, lambda searches: (
+            [self._response(page_hits, total=10)] + [self._response()] * (len(searches) - 1)
+        ))
+
+    def test_page_size(self):
+        """ test every type is searched for page_size hits, capped at the maximum """
+        _, bodies = self._search([], page_size=5)
+        self.assertEqual([body['size'] for body in bodies], [5] * 4)
+
+        _, bodies = self._search([], page_size=1000)
+        self.assertEqual([body['size'] for body in bodies], [MAX_PAGE_SIZE] * 4)
+
+        response, bodies = self._search([], page_size='invalid')
+        self.assertEqual([body['size'] for body in bodies], [DEFAULT_PAGE_SIZE] * 4)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['meta']['page_size'], DEFAULT_PAGE_SIZE)
+
+    def test_cursor(self):
+        """
+        test the next cursor continues after the last hit returned by elasticsearch, including hits of
+        objects missing from the database, and is null once a type returns less than a full page
+        """
+        stale_hit = self._hit(0, 2.0)
+        response, bodies = self._search([self._hit(self.pages[0].id, 3.0), stale_hit], page_size=2)
+        results = json.loads(response.content.decode('utf-8'))
+        self.assertNotIn('search_after', bodies[0])
+        self.assertEqual([hit['page_id'] for hit in results['hits']], [self.pages[0].id])
+        self.assertIsNotNone(results['meta']['next_cursor'])
+
+        response, bodies = self._search(
+            [self._hit(self.pages[1].id, 1.0)], page_size=2, cursor=results['meta']['next_cursor']
+        )
+        results = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(bodies[0]['search_after'], stale_hit['sort'])
+        self.assertNotIn('search_after', bodies[1])
+        self.assertEqual([hit['page_id'] for hit in results['hits']], [self.pages[1].id])
+        self.assertIsNone(results['meta']['next_cursor'])
+
+    def test_hits_left_out_of_page(self):
+        """ test there is a next page when hits returned by elasticsearch didn't fit in the merged page """
+        response, _ = self._search([self._hit(self.pages[0].id, 3.0), self._hit(self.pages[1].id, 2.0)], page_size=1)
+        results = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([hit['page_id'] for hit in results['hits']], [self.pages[0].id])
+
+        cursor = SearchView._decode_cursor(results['meta']['next_cursor'])  # pylint: disable=protected-access
+        self.assertEqual(cursor, {'text': [3.0, str(self.pages[0].id)]})
+
+    def test_invalid_cursor(self):
+        """ test an invalid cursor is a bad request """
+        encode_cursor = SearchView._encode_cursor  # pylint: disable=protected-access
+        for cursor in ('invalid', encode_cursor([1]), encode_cursor({'text': [0, [1]]}),
+                       encode_cursor({'text': ['abc', 'x']}), encode_cursor({'text': [1.0, 2]}),
+                       encode_cursor({'text': [1.0]})):
+            response, bodies = self._search([], cursor=cursor)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(bodies, [])
+
+
+class TestSearchJournalCounts(MockedSearchTestCase):
+    """ Test Cases for counting the matches per journal, elasticsearch mocked """
+
+    def setUp(self):
+        super(TestSearchJournalCounts, self).setUp()
+        self.about_pages = [
+            self._create_journal_about_page('journal-counts-about-page-{}'.format(i)) for i in range(2)
+        ]
+
+    def test_component_shared_by_journals(self):
+        """ test a component used in two journals is only counted in the journal searched """
+        page = JournalPage.objects.filter(journal_about_page=self.about_pages[0], videos__isnull=False).first()
+        video = page.videos.first()
+        JournalPage.objects.filter(journal_about_page=self.about_pages[1]).first().videos.add(video)
+        journal_ids = [about_page.journal_id for about_page in self.about_pages]
+        self.assertEqual(video.journal_ids(), sorted(journal_ids))
+
+        def get_responses(searches):
+            """ The video is the only hit, of the last search """
+            # elasticsearch only counts the journals included in the aggregation
+            included = searches[-1]['aggs'][JOURNAL_COUNTS_AGGREGATION]['terms']['include']
+            buckets = [{'key': str(journal_id), 'doc_count': 1} for journal_id in video.journal_ids()
+                       if str(journal_id) in included]
+            return [self._response()] * (len(searches) - 1) + [
+                self._response([self._hit(video.pk, 1.0)], buckets=buckets)
+            ]
+
+        response, bodies = self._get(
+            reverse('api:v1:journal_search', args=(journal_ids[0],)),
+            {PARAM_QUERY: 'query', PARAM_TYPE: TYPE_VIDEO},
+            get_responses
+        )
+
+        self.assertEqual(len(bodies), 1)
+        self.assertEqual(bodies[0]['aggs'][JOURNAL_COUNTS_AGGREGATION]['terms']['include'], [str(journal_ids[0])])
+        meta = json.loads(response.content.decode('utf-8'))['meta']
+        self.assertEqual(meta['journal_counts'], {str(journal_ids[0]): 1})
+        self.assertEqual(meta['total_count'], 1)
+
+
+class TestSearchHits(MockedSearchTestCase):
+    """ Test Cases for building the SearchHits of search results """
+
+    def setUp(self):
+        super(TestSearchHits, self).setUp()
+        self.about_page = self._create_journal_about_page('search-hits-about-page')
+
+    def test_build_hit_list(self):
+        pages = list(JournalPage.objects.filter(
+            journal_about_page=self.about_page, documents__isnull=False
+        ).distinct().order_by('id'))
+        page_hit = pages[0]
+        document = pages[0].documents.first()
+        document_page_ids = list(document.journalpage_set.order_by('path').values_list('id', flat=True))
+        for result in (page_hit, document):
+            result.search_results_metadata = {}
+        journal_pages = JournalPage.objects.live().public()
+
+        with self.assertNumQueries(3):
+            hit_list = SearchHit.build_hit_list([page_hit, document], journal_pages, [self.about_page])
+
+        self.assertEqual([hit.page_id for hit in hit_list], [page_hit.id] + document_page_ids)
+        self.assertEqual(hit_list[1].block_type, PDF_BLOCK_TYPE)
+        for hit in hit_list:
+            self.assertEqual(hit.journal_about_page_id, self.about_page.id)
+            self.assertEqual(hit.journal_id, self.about_page.journal_id)
+            self.assertEqual(
+                hit.breadcrumbs,
+                [page.title for page in hit.journal_page.get_ancestors().type(JournalPage).live()]
+            )
+
+    def test_build_hit_list_stale_page_hit(self):
+        """ test page hits outside of the journals searched, not reindexed yet after a move, are skipped """
+        other_about_page = self._create_journal_about_page('other-search-hits-about-page')
+        page_hit = JournalPage.objects.filter(journal_about_page=self.about_page).first()
+        stale_page_hit = JournalPage.objects.filter(journal_about_page=other_about_page).first()
+        for result in (page_hit, stale_page_hit):
+            result.search_results_metadata = {}
+
+        hit_list = SearchHit.build_hit_list(
+            [stale_page_hit, page_hit], JournalPage.objects.live().public(), [self.about_page]
+        )
+
+        self.assertEqual([hit.page_id for hit in hit_list], [page_hit.id])
+
+    def test_build_hit_list_stale_component_page(self):
+        """ test component hits on pages moved out of the journals searched, not updated yet, are skipped """
+        other_about_page = self._create_journal_about_page('other-search-hits-about-page')
+        document = JournalPage.objects.filter(
+            journal_about_page=other_about_page, documents__isnull=False
+        ).first().documents.first()
+        document.search_results_metadata = {}
+        # the moved pages still point to the journal searched
+        document.journalpage_set.update(journal_about_page=self.about_page)
+
+        hit_list = SearchHit.build_hit_list([document], JournalPage.objects.live().public(), [self.about_page])
+
+        self.assertEqual(hit_list, [])
@@ -4,7 +4,7 @@ from django.conf.urls import url
 
 from journals.apps.api.v1.preview.views import PreviewView
 from journals.apps.api.v1.theming.views import SiteBrandingViewSet, SiteInformationView
-from journals.apps.api.v1.search.views import SearchView
+from journals.apps.api.v1.search.views import SearchView, SuggestView
 from journals.apps.api.v1.views import CurrentUserView, JournalAccessViewSet, UserPageVisitViewSet, UserAccountView
 
 
@@ -36,6 +36,16 @@ urlpatterns += [
         SearchView.as_view(),
         name='journal_search'
     ),
+    url(
+        r'^search/suggest/$',
+        SuggestView.as_view(),
+        name='multi_journal_suggest'
+    ),
+    url(
+        r'^search/(?P<journal_id>[\d]+)/suggest/$',
+        SuggestView.as_view(),
+        name='journal_suggest'
+    ),
     url(
         r'^siteinfo/$',
         SiteInformationView.as_view(),
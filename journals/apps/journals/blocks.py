@@ -3,6 +3,7 @@ import logging
 from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup as parser
+from django.core.cache import cache
 from django.utils import six
 from wagtail.wagtailcore import blocks
 from wagtail.wagtailcore.models import Page
@@ -12,7 +13,14 @@ from wagtail.wagtailcore.rich_text import extract_attrs, get_link_handler, get_e
 
 from journals.apps.journals.models import JournalDocument, Video
 from journals.apps.journals.widgets import AdminVideoChooser
-from journals.apps.journals.utils import get_image_url, get_span_id
+from journals.apps.journals.utils import (
+    get_cache_key,
+    get_cache_stamps,
+    get_image_url,
+    get_span_id,
+    make_md5_hash,
+    touch_cache_stamps,
+)
 
 PDF_BLOCK_TYPE = 'pdf'
 VIDEO_BLOCK_TYPE = 'xblock_video'
@@ -22,6 +30,8 @@ RAW_HTML_BLOCK_TYPE = 'raw_html'
 STREAM_DATA_TYPE_FIELD = 'type'
 STREAM_DATA_DOC_FIELD = 'doc'
 STREAM_DATA_VIDEO_FIELD = 'video'
+STREAM_DATA_IMAGE_FIELD = 'image'
+RICH_TEXT_CACHE_TIMEOUT = 60 * 60 * 24
 
 log = logging.getLogger(__name__)
 
@@ -42,11 +52,45 @@ class VideoChooserBlock(blocks.ChooserBlock):
             return value
 
 
-class PDFBlock(blocks.StructBlock):
+class BulkChooserStructBlock(blocks.StructBlock):
+    """
+    StructBlock with a chooser child whose objects are loaded for all blocks of this type in one query.
+    StreamValue calls bulk_to_python with every raw value of the block type in the stream the first
+    time one of them is accessed, so serializing a page body costs one query per media type.
+    """
+    chooser_field = None
+
+    def get_chooser_queryset(self):
+        return self.child_blocks[self.chooser_field].target_model.objects.all()
+
+    def bulk_to_python(self, values):
+        """ Convert the raw values of all blocks of this type at once, loading their chosen objects in one query """
+        values = list(values)
+        object_ids = {value.get(self.chooser_field) for value in values} - {None}
+        objects = self.get_chooser_queryset().in_bulk(object_ids) if object_ids else {}
+
+        return [self._to_python_with_objects(value, objects) for value in values]
+
+    def _to_python_with_objects(self, value, objects):
+        """ Same as to_python, except the chooser value is taken from the already loaded objects """
+        child_values = []
+        for name, child_block in self.child_blocks.items():
+            if name not in value:
+                child_values.append((name, child_block.get_default()))
+            elif name == self.chooser_field:
+                child_values.append((name, objects.get(value[name])))
+            else:
+                child_values.append((name, child_block.to_python(value[name])))
+        return blocks.StructValue(self, child_values)
+
+
+class PDFBlock(BulkChooserStructBlock):
     """PDFBlock component"""
     doc = DocumentChooserBlock()
     title = blocks.CharBlock(required=False, help_text='Override document title')
 
+    chooser_field = STREAM_DATA_DOC_FIELD
+
     def get_title(self, value):
         return value.get('title')
 
@@ -86,8 +130,16 @@ class JournalRichTextBlock(blocks.RichTextBlock):
     def expand_db_html(html, for_editor=False, base_url='/'):
         """
         Override from wagtail.wagtailcore.rich_text to use full path
-        to embedded images
+        to embedded images. Linked pages and documents are loaded with one query per link type.
         """
+        link_ids = JournalRichTextBlock.get_link_ids(html)
+        pages = {}
+        if link_ids['page']:
+            pages = {str(page.id): page for page in Page.objects.filter(id__in=link_ids['page']).specific()}
+        documents = {}
+        if link_ids['document']:
+            documents = {str(doc.id): doc for doc in JournalDocument.objects.filter(id__in=link_ids['document'])}
+
         def replace_a_tag(m):
             """
             overridden, return href for Pages and Documents that
@@ -98,18 +150,16 @@ class JournalRichTextBlock(blocks.RichTextBlock):
                 # return unchanged
                 return m.group(0)
             if attrs['linktype'] == 'page':
-                try:
-                    page = Page.objects.get(id=attrs['id'])
-                    return '<a href="{page_path}">'.format(page_path=page.specific.get_frontend_page_path())
-                except Page.DoesNotExist:
-                    return "<a>"
+                page = pages.get(attrs['id'])
+                if page:
+                    return '<a href="{page_path}">'.format(page_path=page.get_frontend_page_path())
+                return "<a>"
 
             if attrs['linktype'] == 'document':
-                try:
-                    doc = JournalDocument.objects.get(id=attrs['id'])
+                doc = documents.get(attrs['id'])
+                if doc:
                     return '<a href="{viewer_path}" target="_blank">'.format(viewer_path=doc.get_viewer_url(base_url))
-                except Page.DoesNotExist:
-                    return "<a>"
+                return "<a>"
 
             handler = get_link_handler(attrs['linktype'])
             return handler.expand_db_attributes(attrs, for_editor)
@@ -130,6 +180,47 @@ class JournalRichTextBlock(blocks.RichTextBlock):
         html = FIND_EMBED_TAG.sub(replace_embed_tag, html)
         return html
 
+    @staticmethod
+    def get_link_ids(html):
+        """
+        Return a dict of link type ('page', 'document' or 'image') to the ids of the objects linked or embedded in html
+        """
+        link_ids = {'page': set(), 'document': set(), 'image': set()}
+        for link in FIND_A_TAG.finditer(html):
+            attrs = extract_attrs(link.group(1))
+            if attrs.get('linktype') in ('page', 'document'):
+                link_ids[attrs['linktype']].add(attrs['id'])
+        for embed in FIND_EMBED_TAG.finditer(html):
+            attrs = extract_attrs(embed.group(1))
+            if attrs.get('embedtype') == 'image':
+                link_ids['image'].add(attrs['id'])
+        return link_ids
+
+    @staticmethod
+    def _get_link_stamp_key(link_type, object_id):
+        return get_cache_key(resource='rich_text_link', link_type=link_type, object_id=object_id)
+
+    @classmethod
+    def get_links_stamp(cls, link_ids):
+        """
+        Return a digest of the stamps of the latest changes to the objects in link_ids, which
+        the expanded html of rich text and the API responses of pages using them are keyed by
+        """
+        stamp_keys = sorted(
+            cls._get_link_stamp_key(link_type, object_id)
+            for link_type, object_ids in link_ids.items() for object_id in object_ids
+        )
+        stamps = get_cache_stamps(stamp_keys)
+        return make_md5_hash(','.join(stamps[key] for key in stamp_keys))
+
+    @classmethod
+    def invalidate_expanded_html(cls, link_type, object_ids):
+        """
+        Called when pages are published, unpublished or moved, or documents, images or videos change,
+        so only the rich text and page responses using them are built again
+        """
+        touch_cache_stamps([cls._get_link_stamp_key(link_type, object_id) for object_id in object_ids])
+
     def get_api_representation(self, value, context=None):
         request = context['request']
         base_url = urljoin("{}://{}:{}".format(
@@ -137,7 +228,18 @@ class JournalRichTextBlock(blocks.RichTextBlock):
             request.site.hostname,
             request.site.port,
         ), '/')
-        return self.expand_db_html(value.source, base_url=base_url)
+
+        cache_key = get_cache_key(
+            resource='rich_text',
+            content_hash=make_md5_hash(value.source),
+            base_url=base_url,
+            links=self.get_links_stamp(self.get_link_ids(value.source)),
+        )
+        html = cache.get(cache_key)
+        if html is None:
+            html = self.expand_db_html(value.source, base_url=base_url)
+            cache.set(cache_key, html, RICH_TEXT_CACHE_TIMEOUT)
+        return html
 
 
 class JournalRawHTMLBlock(blocks.RawHTMLBlock):
@@ -156,11 +258,17 @@ class JournalRawHTMLBlock(blocks.RawHTMLBlock):
         return [parser(six.text_type(value), 'html.parser').get_text()]
 
 
-class XBlockVideoBlock(blocks.StructBlock):
+class XBlockVideoBlock(BulkChooserStructBlock):
     """XBlockVideoBlock component"""
     video = VideoChooserBlock(required=True)
     title = blocks.CharBlock(required=False, help_text='Override video title')
 
+    chooser_field = STREAM_DATA_VIDEO_FIELD
+
+    def get_chooser_queryset(self):
+        # the journal lookup is prefetched for the view_url returned in the api representation
+        return super(XBlockVideoBlock, self).get_chooser_queryset().prefetch_related('video_journals')
+
     def get_title(self, value):
         return value.get('title')
 
@@ -193,7 +301,7 @@ class XBlockVideoBlock(blocks.StructBlock):
         }
 
 
-class JournalImageChooserBlock(blocks.StructBlock):
+class JournalImageChooserBlock(BulkChooserStructBlock):
     """ JournalImageChooserBlock component """
     image = ImageChooserBlock()
     title = blocks.CharBlock(required=False, help_text='Override image title')
@@ -203,8 +311,14 @@ class JournalImageChooserBlock(blocks.StructBlock):
         features=['h1', 'h2', 'h3', 'ol', 'ul', 'bold', 'italic', 'link', 'hr', 'document-link']
     )
 
+    chooser_field = STREAM_DATA_IMAGE_FIELD
+
+    def get_chooser_queryset(self):
+        # renditions are prefetched for the 'original' url returned in the api representation
+        return super(JournalImageChooserBlock, self).get_chooser_queryset().prefetch_related('renditions')
+
     def get_image(self, value):
-        return value.get('image')
+        return value.get(STREAM_DATA_IMAGE_FIELD)
 
     def get_title(self, value):
         return value.get('title')
@@ -1,22 +1,72 @@
 """
 Handlers for journal page signals
 """
-from django.db.models.signals import pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch.dispatcher import receiver
 from journals.apps.journals.utils import delete_block_references
+from journals.apps.search.index_queue import index_updated
+from wagtail.wagtailcore.models import Page, PageViewRestriction
 from wagtail.wagtailcore.signals import page_published, page_unpublished
 
-from .models import JournalAboutPage, JournalPage, JournalDocument, JournalImage
+from .models import (
+    JournalAboutPage,
+    JournalAccess,
+    JournalDocument,
+    JournalImage,
+    JournalImageRendition,
+    JournalPage,
+    Video,
+    VideoJournal,
+)
+
+
+def update_journal_navigation(journal_about_page):
+    """
+    Invalidate the cached structure and search results, and rebuild the reading order of the given journal
+    """
+    if journal_about_page:
+        journal_about_page.invalidate_structure()
+        JournalAboutPage.invalidate_search_results([journal_about_page.id])
+        journal_about_page.update_reading_order()
+
+
+def _get_journal_about_ids(journal_pages):
+    return set(
+        journal_pages.filter(journal_about_page__isnull=False).values_list('journal_about_page_id', flat=True)
+    )
+
+
+def invalidate_page_links(page_ids):
+    """
+    Invalidate the expanded html of the rich text linking to the given pages
+    """
+    from .blocks import JournalRichTextBlock
+    JournalRichTextBlock.invalidate_expanded_html('page', page_ids)
 
 
 def page_pub_receiver(sender, **kwargs):  # pylint: disable=unused-argument
     journal_page = kwargs['instance']
     journal_page.update_related_objects()
+    invalidate_page_links([journal_page.id])
+    update_journal_navigation(journal_page.journal_about_page)
 
 
 def page_unpub_receiver(sender, **kwargs):  # pylint: disable=unused-argument
     journal_page = kwargs['instance']
     journal_page.update_related_objects(clear=True)
+    invalidate_page_links([journal_page.id])
+    update_journal_navigation(journal_page.journal_about_page)
+
+
+def page_deleted_receiver(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Post_delete signal for JournalPage. Page.delete sends neither page_published nor
+    page_unpublished, so this is where we rebuild the navigation of the journal a deleted
+    JournalPage belonged to.
+    """
+    invalidate_page_links([instance.id])
+    # the about page may be deleted along with its pages
+    update_journal_navigation(JournalAboutPage.objects.filter(id=instance.journal_about_page_id).first())
 
 
 def about_page_pub_receiver(sender, **kwargs):  # pylint: disable=unused-argument
@@ -29,18 +79,48 @@ def about_page_unpub_receiver(sender, **kwargs):  # pylint: disable=unused-argum
     journal_about_page.update_related_objects(deactivate=True)
 
 
+def page_moved_receiver(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Post_save signal for the base Page model. Page.move saves the moved page through the
+    base Page model, so this is where we rebuild the navigation of the journals a moved
+    JournalPage left and joined.
+    """
+    if instance.specific_class is not JournalPage:
+        return
+
+    journal_page = instance.specific
+    old_journal_about_page = journal_page.journal_about_page
+    new_journal_about_page = journal_page._calculate_journal_about_page()  # pylint: disable=protected-access
+    if old_journal_about_page != new_journal_about_page:
+        moved_pages = JournalPage.objects.descendant_of(journal_page, inclusive=True)
+        moved_pages.update(journal_about_page=new_journal_about_page)
+        # the frontend paths of the moved pages contain their about page
+        invalidate_page_links(list(moved_pages.values_list('id', flat=True)))
+        VideoJournal.set_pages_journal(moved_pages, new_journal_about_page)
+        JournalPage.update_search_index_with_components(moved_pages)
+        update_journal_navigation(old_journal_about_page)
+
+    update_journal_navigation(new_journal_about_page)
+
+
 def connect_page_signals_handlers():
+    """ Connect the receivers keeping the navigation and related objects of journals up to date """
     page_published.connect(page_pub_receiver, sender=JournalPage)
     page_unpublished.connect(page_unpub_receiver, sender=JournalPage)
+    post_delete.connect(page_deleted_receiver, sender=JournalPage)
     page_published.connect(about_page_pub_receiver, sender=JournalAboutPage)
     page_unpublished.connect(about_page_unpub_receiver, sender=JournalAboutPage)
+    post_save.connect(page_moved_receiver, sender=Page)
 
 
 def disconnect_page_signals_handlers():
+    """ Disconnect the receivers connected by connect_page_signals_handlers, e.g. in tests """
     page_published.disconnect(page_pub_receiver, sender=JournalPage)
     page_unpublished.disconnect(page_unpub_receiver, sender=JournalPage)
+    post_delete.disconnect(page_deleted_receiver, sender=JournalPage)
     page_published.disconnect(about_page_pub_receiver, sender=JournalAboutPage)
     page_unpublished.disconnect(about_page_unpub_receiver, sender=JournalAboutPage)
+    post_save.disconnect(page_moved_receiver, sender=Page)
 
 
 @receiver(pre_delete, sender=JournalDocument)
@@ -63,4 +143,105 @@ def delete_image_references(sender, instance, *args, **kwargs):     # pylint: di
     delete_block_references(instance, IMAGE_BLOCK_TYPE)
 
 
+@receiver(post_save, sender=JournalDocument)
+@receiver(post_delete, sender=JournalDocument)
+def document_changed(sender, instance, *args, **kwargs):     # pylint: disable=unused-argument
+    """
+    Post_save/post_delete signal for JournalDocument which invalidates
+    the rich text expanded with links to the document.
+    """
+    from .blocks import JournalRichTextBlock
+    JournalRichTextBlock.invalidate_expanded_html('document', [instance.id])
+
+
+@receiver(post_save, sender=JournalImage)
+@receiver(post_delete, sender=JournalImage)
+def image_changed(sender, instance, *args, **kwargs):     # pylint: disable=unused-argument
+    """
+    Post_save/post_delete signal for JournalImage which invalidates
+    the rich text expanded with the image embedded.
+    """
+    from .blocks import JournalRichTextBlock
+    JournalRichTextBlock.invalidate_expanded_html('image', [instance.id])
+
+
+@receiver(post_save, sender=JournalImageRendition)
+@receiver(post_delete, sender=JournalImageRendition)
+def image_rendition_changed(sender, instance, *args, **kwargs):     # pylint: disable=unused-argument
+    """
+    Post_save/post_delete signal for JournalImageRendition which invalidates
+    the cached page responses with the url of the image.
+    """
+    from .blocks import JournalRichTextBlock
+    JournalRichTextBlock.invalidate_expanded_html('image', [instance.image_id])
+
+
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+def video_changed(sender, instance, *args, **kwargs):     # pylint: disable=unused-argument
+    """
+    Post_save/post_delete signal for Video which invalidates
+    the cached page responses with the video embedded.
+    """
+    from .blocks import JournalRichTextBlock
+    JournalRichTextBlock.invalidate_expanded_html('video', [instance.id])
+
+
+@receiver(post_save, sender=PageViewRestriction)
+@receiver(post_delete, sender=PageViewRestriction)
+def page_view_restriction_changed(sender, instance, *args, **kwargs):     # pylint: disable=unused-argument
+    """
+    Post_save/post_delete signal for PageViewRestriction which reindexes the journal
+    pages made private or public, with the documents, images and videos they use.
+    """
+    page = Page.objects.filter(id=instance.page_id).first()
+    if page:
+        journal_pages = JournalPage.objects.descendant_of(page, inclusive=True)
+        JournalPage.update_search_index_with_components(journal_pages)
+        JournalAboutPage.invalidate_search_results(_get_journal_about_ids(journal_pages))
+
+
+@receiver(post_save, sender=JournalDocument)
+@receiver(pre_delete, sender=JournalDocument)
+@receiver(post_save, sender=JournalImage)
+@receiver(pre_delete, sender=JournalImage)
+@receiver(post_save, sender=Video)
+@receiver(pre_delete, sender=Video)
+def search_media_changed(sender, instance, *args, **kwargs):     # pylint: disable=unused-argument
+    """
+    Post_save/pre_delete signal for JournalDocument, JournalImage and Video which invalidates
+    the cached search results of the journals with pages using them.
+    """
+    JournalAboutPage.invalidate_search_results(_get_journal_about_ids(instance.journalpage_set.all()))
+
+
+@receiver(index_updated)
+def search_index_updated(sender, objects, **kwargs):     # pylint: disable=unused-argument
+    """
+    Signal sent once the documents of JournalPages or media are written to the index by the
+    queue, after their changes invalidated the search results of their journals. Invalidates
+    them again, searches run meanwhile cached the previous documents.
+    """
+    object_ids = [obj.pk for obj in objects]
+    if issubclass(sender, Page):
+        journal_pages = JournalPage.objects.filter(pk__in=object_ids)
+    elif sender in (JournalDocument, JournalImage, Video):
+        journal_pages = JournalPage.objects.filter(
+            pk__in=sender.objects.filter(pk__in=object_ids).values('journalpage')
+        )
+    else:
+        return
+    JournalAboutPage.invalidate_search_results(_get_journal_about_ids(journal_pages))
+
+
+@receiver(post_save, sender=JournalAccess)
+@receiver(post_delete, sender=JournalAccess)
+def journal_access_changed(sender, instance, *args, **kwargs):     # pylint: disable=unused-argument
+    """
+    Post_save/post_delete signal for JournalAccess which invalidates
+    the cached journal ids the user has access to.
+    """
+    JournalAccess.invalidate_user_accessible_journals(instance.user_id)
+
+
 connect_page_signals_handlers()
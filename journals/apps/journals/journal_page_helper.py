@@ -33,60 +33,63 @@ class UserJournalPagePermissionsProxy(UserPagePermissionsProxy):
 class JournalPageMixin(object):
     """ This class contains methods that are shared between Journal Page Types """
 
-    def flatten_children(self, children):
-        """
-        Children should always be a list of dicts. In the case that a there is an unpublished page between two
-        published pages, the unpublished page will simply be a list of it's children, instead of a dict of it's
-        content, plus a children field. This flattens that list of children into the parent list children to keep
-        a valid tree structure.
-        """
-        flat_children = []
-        for child in children:
-            if isinstance(child, dict):
-                flat_children.append(child)
-            elif isinstance(child, list):
-                for subchild in child:
-                    flat_children.append(subchild)
-        return flat_children
-
     def get_nested_children(self, live_only=True):
         """ Return dict hierarchy with self as root """
+        children = self.get_nested_descendants(live_only=live_only)
+        has_children = bool(children) if live_only else self.numchild > 0
 
         # TODO: can remove "url" field once we move to seperated front end
         if self.live:
-            structure = {
+            return {
                 "title": self.title,
-                "children": None,
+                "children": children if has_children else None,
                 "id": self.id,
                 "url": self.url
             }
-        else:
-            structure = None
-
-        children = self.get_children()
-        if not children or (live_only and self.get_descendants().live().count() == 0):
-            return structure
-
-        if structure:
-            structure_children = [
-                struct for struct in
-                (
-                    child.specific.get_nested_children(live_only=live_only)
-                    for child in children
-                )
-                if struct is not None
-            ]
-            structure["children"] = self.flatten_children(structure_children)
-        else:
-            structure = [
-                struct for struct in
-                (
-                    child.specific.get_nested_children(live_only=live_only)
-                    for child in children
-                )
-                if struct is not None
-            ]
-            structure = self.flatten_children(structure)
+
+        return children if has_children else None
+
+    def get_nested_descendants(self, live_only=True):
+        """
+        Return the dict hierarchy of the descendants of this page as a list, built from a
+        single query ordered on the treebeard path.
+
+        In the case that there is an unpublished page between two published pages, the
+        unpublished page is replaced by its children to keep a valid tree structure. A
+        published page with no published descendants has None for children.
+        """
+        from wagtail.wagtailcore.models import Page
+
+        descendants = Page.objects.descendant_of(self).order_by('path').only(
+            'id', 'title', 'live', 'path', 'depth', 'numchild', 'url_path'
+        )
+
+        structure = []
+        # stack of (path, node) for the ancestors of the current page, where node is the
+        # structure dict that the descendants of that page are attached to (None for self)
+        ancestors = []
+        for page in descendants:
+            while ancestors and not page.path.startswith(ancestors[-1][0]):
+                ancestors.pop()
+
+            parent_node = ancestors[-1][1] if ancestors else None
+            node = parent_node
+
+            if page.live:
+                node = {
+                    "title": page.title,
+                    "children": [] if page.numchild and not live_only else None,
+                    "id": page.id,
+                    "url": page.url
+                }
+                if parent_node is None:
+                    structure.append(node)
+                else:
+                    if parent_node["children"] is None:
+                        parent_node["children"] = []
+                    parent_node["children"].append(node)
+
+            ancestors.append((page.path, node))
 
         return structure
 
@@ -17,7 +17,7 @@ from urllib.parse import urlsplit, urlunsplit
 from django.core.management.base import BaseCommand
 from wagtail.wagtailcore.models import Collection, Site
 
-from journals.apps.journals.models import Journal, Video
+from journals.apps.journals.models import Journal, Video, VideoTranscript
 
 logger = logging.getLogger(__name__)
 
@@ -195,6 +195,11 @@ class Command(BaseCommand):
 
         return blocks if blocks else []
 
+    @staticmethod
+    def get_transcript_url(block):
+        '''url of the english transcript of a video block, None if it has none'''
+        return block.get('student_view_data', {}).get('transcripts', {}).get('en')
+
     def get_videos_for_site(self, site):
         '''get_videos for given site'''
         if not hasattr(site, 'siteconfiguration'):
@@ -245,11 +250,14 @@ class Command(BaseCommand):
             blocks = block_collection.get('blocks')
             block_ids = []
 
+            # transcripts are refreshed concurrently before the videos are saved, only the changed ones are downloaded
+            VideoTranscript.refresh_many(filter(None, (self.get_transcript_url(block) for block in blocks.values())))
+
             for block in blocks:
                 block_id = blocks[block].get('block_id')
                 display_name = blocks[block].get('display_name')
                 view_url = blocks[block].get('student_view_url')
-                transcript_url = blocks[block].get('student_view_data', {}).get('transcripts', {}).get('en')
+                transcript_url = self.get_transcript_url(blocks[block])
                 view_url = self.rewrite_url_for_external_use(view_url, site)
                 block_ids.append(block_id)
 
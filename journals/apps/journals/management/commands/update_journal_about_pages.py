@@ -0,0 +1,77 @@
+"""
+Management command to fill and repair the journal_about_page of journal pages,
+e.g. after pages have been moved between journals.
+Possible ways to run this command
+To update the pages of all journals
+`./manage.py update_journal_about_pages`
+
+To update the pages of journals having ids 101, 102
+`./manage.py update_journal_about_pages --journal_ids 101 102`
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+
+from journals.apps.journals.handlers import invalidate_page_links, update_journal_navigation
+from journals.apps.journals.models import JournalAboutPage, JournalPage, VideoJournal
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    '''Management command to update journal_about_page of journal pages'''
+    help = 'Fills and repairs the journal_about_page of journal pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journal_ids', dest='journal_ids', nargs='+', type=int)
+
+    def update_journal_pages(self, journal_about_page):
+        """
+        Point every page beneath journal_about_page to it and detach the pages
+        that still point to it but have been moved out of the journal, then reindex
+        the updated pages and invalidate the cached data depending on their journal
+
+        Returns: number of pages updated
+        """
+        moved_in_ids = list(JournalPage.objects.descendant_of(journal_about_page).exclude(
+            journal_about_page=journal_about_page
+        ).values_list('id', flat=True))
+        # Pages moved into another journal are fixed when that journal is updated
+        moved_out_ids = list(JournalPage.objects.filter(
+            journal_about_page=journal_about_page
+        ).exclude(
+            path__startswith=journal_about_page.path
+        ).values_list('id', flat=True))
+
+        JournalPage.objects.filter(id__in=moved_in_ids).update(journal_about_page=journal_about_page)
+        JournalPage.objects.filter(id__in=moved_out_ids).update(journal_about_page=None)
+
+        updated_ids = moved_in_ids + moved_out_ids
+        if updated_ids:
+            VideoJournal.set_pages_journal(
+                JournalPage.objects.descendant_of(journal_about_page), journal_about_page
+            )
+            # the frontend paths of the updated pages contain their about page
+            invalidate_page_links(updated_ids)
+            JournalPage.update_search_index_with_components(JournalPage.objects.filter(id__in=updated_ids))
+            update_journal_navigation(journal_about_page)
+
+        return len(updated_ids)
+
+    def handle(self, *args, **options):
+        journal_about_pages = JournalAboutPage.objects.all()
+        if options['journal_ids']:
+            journal_about_pages = journal_about_pages.filter(journal_id__in=options['journal_ids'])
+
+        total_updated = 0
+        for journal_about_page in journal_about_pages:
+            updated = self.update_journal_pages(journal_about_page)
+            total_updated += updated
+            status_msg = "Updated {count} pages of journal '{title}'".format(
+                count=updated,
+                title=journal_about_page.title
+            )
+            self.stdout.write(status_msg)
+            logger.info(status_msg)
+
+        return "Completed, %s pages updated" % total_updated
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-17 07:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_reading_order(apps, schema_editor):
+    """ Rank the live pages of every journal in depth-first reading order (treebeard path order) """
+    JournalAboutPage = apps.get_model('journals', 'JournalAboutPage')
+    JournalPage = apps.get_model('journals', 'JournalPage')
+    for about_page in JournalAboutPage.objects.all():
+        live_pages = JournalPage.objects.filter(
+            path__startswith=about_page.path,
+            depth__gt=about_page.depth,
+            live=True
+        ).order_by('path')
+        for rank, page in enumerate(live_pages):
+            JournalPage.objects.filter(pk=page.pk).update(reading_order=rank)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journals', '0029_auto_20181029_0903'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalpage',
+            name='reading_order',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='journalpage',
+            index_together=set([('journal_about_page', 'reading_order')]),
+        ),
+        migrations.RunPython(populate_reading_order, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-17 08:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_video_journals(apps, schema_editor):
+    """ Add a lookup row for every video of every live journal page """
+    JournalPage = apps.get_model('journals', 'JournalPage')
+    VideoJournal = apps.get_model('journals', 'VideoJournal')
+    journal_pages = JournalPage.objects.filter(
+        live=True,
+        journal_about_page__isnull=False,
+        journal_about_page__journal__isnull=False,
+    ).select_related('journal_about_page__journal').prefetch_related('videos')
+    for journal_page in journal_pages:
+        VideoJournal.objects.bulk_create([
+            VideoJournal(
+                video=video,
+                journal_page=journal_page,
+                journal_uuid=journal_page.journal_about_page.journal.uuid
+            )
+            for video in journal_page.videos.all()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journals', '0030_journalpage_reading_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoJournal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('journal_uuid', models.UUIDField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='videojournal',
+            name='journal_page',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='video_journals', to='journals.JournalPage'),
+        ),
+        migrations.AddField(
+            model_name='videojournal',
+            name='video',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='video_journals', to='journals.Video'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='videojournal',
+            unique_together=set([('video', 'journal_page')]),
+        ),
+        migrations.RunPython(populate_video_journals, migrations.RunPython.noop),
+    ]
@@ -1,21 +1,25 @@
 '''Journal Models'''
 from __future__ import absolute_import, unicode_literals
 
-import base64
 import datetime
+import itertools
 import json
 import logging
 import mimetypes
 import uuid
+import zlib
 from urllib.parse import quote, urljoin, urlparse, urlsplit, urlunsplit
 
 import requests
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.db import models
+from django.db.models import Case, Value, When
 
 from django.http import HttpResponseRedirect
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from model_utils.models import TimeStampedModel
 
@@ -32,7 +36,7 @@ from wagtail.wagtailcore.models import Collection, CollectionMember, Page
 from wagtail.wagtailcore.permission_policies.collections import CollectionOwnershipPermissionPolicy
 from wagtail.wagtaildocs.models import AbstractDocument, Document
 from wagtail.wagtailimages.edit_handlers import ImageChooserPanel
-from wagtail.wagtailimages.models import AbstractImage, AbstractRendition, Image
+from wagtail.wagtailimages.models import AbstractImage, AbstractRendition, Filter, Image
 from wagtail.wagtailsearch import index
 from wagtail.wagtailsearch.queryset import SearchableQuerySetMixin
 
@@ -40,10 +44,17 @@ from journals.apps.core.models import User
 from journals.apps.journals.api_utils import update_service
 from journals.apps.journals.journal_page_helper import JournalPageMixin, ReferencedObjectMixin
 from journals.apps.journals.utils import (
+    extract_pdf_text,
     get_cache_key,
+    get_cache_stamps,
+    get_file_sha256,
     get_image_url,
     get_default_expiration_date,
+    get_prefetch_session,
+    iter_concurrently,
     lms_integration_enabled,
+    touch_cache_stamps,
+    update_search_index,
 )
 from journals.apps.search.backend import LARGE_TEXT_FIELD_SEARCH_PROPS
 
@@ -52,6 +63,10 @@ logger = logging.getLogger(__name__)
 JOURNAL_PAGE_PREVIEW_PATH = 'pagePreview'
 JOURNAL_ABOUT_PAGE_PREVIEW_PATH = 'aboutPreview'
 JOURNAL_INDEX_PAGE_PREVIEW_PATH = 'indexPreview'
+JOURNAL_STRUCTURE_CACHE_TIMEOUT = 60 * 60 * 24  # structure is invalidated on publish, so it can live for a day
+READING_ORDER_UPDATE_BATCH_SIZE = 500
+ACCESSIBLE_JOURNALS_CACHE_TIMEOUT = 60 * 60  # also invalidated when access is granted or revoked
+TRANSCRIPT_REQUEST_TIMEOUT = 10  # seconds
 RICH_TEXT_FEATURES = [
     'h1', 'h2', 'h3', 'ol', 'ul', 'bold', 'italic', 'link', 'hr', 'document-link', 'image', 'code-block'
 ]
@@ -212,12 +227,43 @@ class JournalAccess(TimeStampedModel):
 
     @classmethod
     def get_user_accessible_journal_ids(cls, user):
-        """ Finds all journals that user has access to """
+        """
+        Finds all journals that user has access to.
+        For learners the ids are cached until an access is granted, revoked or expires.
+        """
         if user.is_anonymous:
             return []
         if user.can_access_admin:
             return Journal.objects.all().values_list('id', flat=True)
-        return cls.get_active_access_for_user(user).values_list('journal__id', flat=True)
+
+        cache_key = cls._get_accessible_journals_cache_key(user.id)
+        journal_ids = cache.get(cache_key)
+        if journal_ids is None:
+            access_items = list(cls.get_active_access_for_user(user).values_list('journal__id', 'expiration_date'))
+            journal_ids = [journal_id for journal_id, _ in access_items]
+
+            timeout = ACCESSIBLE_JOURNALS_CACHE_TIMEOUT
+            if access_items:
+                # access is valid through its expiration date, so the ids are stale from the next day on
+                first_expired_at = datetime.datetime.combine(
+                    min(expiration_date for _, expiration_date in access_items) + datetime.timedelta(days=1),
+                    datetime.time.min
+                )
+                seconds_to_expiry = (first_expired_at - datetime.datetime.now()).total_seconds()
+                timeout = max(1, min(timeout, int(seconds_to_expiry)))
+
+            cache.set(cache_key, journal_ids, timeout)
+
+        return journal_ids
+
+    @staticmethod
+    def _get_accessible_journals_cache_key(user_id):
+        return get_cache_key(resource='user_accessible_journals', user_id=user_id)
+
+    @classmethod
+    def invalidate_user_accessible_journals(cls, user_id):
+        """ Drops the cached journal ids of the user, called when one of their accesses changes """
+        cache.delete(cls._get_accessible_journals_cache_key(user_id))
 
     @classmethod
     def get_active_access_for_user(cls, user):
@@ -237,11 +283,7 @@ class JournalAccess(TimeStampedModel):
         if user.can_access_admin:
             return True
 
-        access_items = cls.get_active_access_for_user(user).filter(
-            journal=journal
-        )
-
-        return True if access_items else False
+        return journal.id in cls.get_user_accessible_journal_ids(user)
 
     @classmethod
     def create_journal_access(cls, user, journal, order_number=None):
@@ -283,6 +325,10 @@ class JournalAccess(TimeStampedModel):
                 )
         cls.objects.bulk_create(journal_access_list)
 
+        # bulk_create does not send post_save, so invalidate the cached journal ids here
+        for journal_access in journal_access_list:
+            cls.invalidate_user_accessible_journals(journal_access.user_id)
+
     @classmethod
     def revoke_journal_access(cls, order_number):
         """ Revokes access for the access record associated with the given order number """
@@ -309,26 +355,80 @@ class JournalDocument(AbstractDocument, ReferencedObjectMixin):
             allowed_types=settings.ALLOWED_DOCUMENT_TYPES, allowed_extensions=settings.ALLOWED_DOCUMENT_FILE_EXTENSIONS
         )]
     )
+    file_sha256 = models.CharField(max_length=64, blank=True, editable=False)
 
     search_fields = AbstractDocument.search_fields + [
-        index.SearchField('data', partial_match=False),
         index.FilterField('id'),
+        index.FilterField('journal_ids'),
     ]
 
     admin_form_fields = Document.admin_form_fields
 
-    def data(self):
+    def save(self, *args, **kwargs):
+        # pylint: disable=arguments-differ,no-member,protected-access
+        if self.file and not self.file._committed:
+            # a new file is being uploaded, its text is extracted again unless the contents are known
+            self.file_sha256 = get_file_sha256(self.file)
+        super(JournalDocument, self).save(*args, **kwargs)
+
+    def text(self):
         '''
-        Return the contents of the document as base64 encoded
-        data used as input to elasticsearch ingest-attachment plugin
+        Return the plain text of the document indexed for search, extracted from the
+        file only once for all documents with the same contents
         '''
-        # converting to base64 is (Size * 8)/6 times bigger than binary file
-        # determine the max number of bytes we can read to not exceed the max upload size
-        read_max = (settings.MAX_ELASTICSEARCH_UPLOAD_SIZE * 6) / 8
+        if not self.file_sha256:
+            self.file_sha256 = self.read_file_sha256()
+            JournalDocument.objects.filter(pk=self.pk).update(file_sha256=self.file_sha256)
+        try:
+            return DocumentText.objects.get(sha256=self.file_sha256).text
+        except DocumentText.DoesNotExist:
+            pass
+
+        text = self.extract_text()
+        DocumentText.objects.get_or_create(sha256=self.file_sha256, defaults={'text': text})
+        return text
+
+    def read_file_sha256(self):
+        ''' Return the SHA-256 of the stored file, without using the database '''
+        self.file.open()
+        try:
+            return get_file_sha256(self.file)
+        finally:
+            self.file.close()
+
+    def extract_text(self):
+        ''' Return the plain text extracted from the stored file, without using the database '''
+        if not self.is_pdf():
+            return ''
         self.file.open()
-        contents = base64.b64encode(self.file.read(int(read_max))).decode('ascii')
-        self.file.close()
-        return contents
+        try:
+            return extract_pdf_text(self.file, settings.MAX_ELASTICSEARCH_UPLOAD_SIZE)
+        finally:
+            self.file.close()
+
+    @classmethod
+    def prefetch_search_payloads(cls, documents):
+        '''
+        Extract the texts of documents not extracted yet, so that indexing them only reads the stored texts.
+        The files are hashed from a pool of threads, while the texts are extracted one at a time as
+        parsing PDFs is CPU bound and threads would only contend for the GIL.
+        '''
+        unhashed = [document for document in documents if not document.file_sha256]
+        for document, file_sha256 in iter_concurrently(cls.read_file_sha256, unhashed):
+            if file_sha256:
+                document.file_sha256 = file_sha256
+                cls.objects.filter(pk=document.pk).update(file_sha256=file_sha256)
+
+        unextracted = {document.file_sha256: document for document in documents if document.file_sha256}
+        for file_sha256 in DocumentText.objects.filter(sha256__in=unextracted).values_list('sha256', flat=True):
+            del unextracted[file_sha256]
+        for document in unextracted.values():
+            try:
+                text = document.extract_text()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Exception raised while extracting the text of %r', document)
+                continue
+            DocumentText.objects.get_or_create(sha256=document.file_sha256, defaults={'text': text})
 
     def get_viewer_url(self, base_url):
         '''
@@ -347,6 +447,26 @@ class JournalDocument(AbstractDocument, ReferencedObjectMixin):
     def get_object_type(self):
         return "document"
 
+    def journal_ids(self):
+        """
+        Ids of the journals with a live and public page showing this document, indexed
+        so searches can be limited to journals in elasticsearch
+        """
+        return JournalPage.get_public_journal_ids(self.journalpage_set.all())
+
+
+class DocumentText(models.Model):
+    '''
+    Plain text extracted from a document file, keyed by the SHA-256 of the file contents
+    so that reindexing a document never parses its file again
+    '''
+    sha256 = models.CharField(max_length=64, unique=True)
+    text = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
 
 class JournalImage(AbstractImage, ReferencedObjectMixin):
     '''
@@ -358,6 +478,7 @@ class JournalImage(AbstractImage, ReferencedObjectMixin):
     search_fields = AbstractImage.search_fields + [
         index.SearchField('caption', partial_match=True),
         index.FilterField('id'),
+        index.FilterField('journal_ids'),
     ]
 
     admin_form_fields = Image.admin_form_fields + (
@@ -367,6 +488,28 @@ class JournalImage(AbstractImage, ReferencedObjectMixin):
     def get_object_type(self):
         return "image"
 
+    def journal_ids(self):
+        """ Ids of the journals with a live and public page showing this image """
+        return JournalPage.get_public_journal_ids(self.journalpage_set.all())
+
+    def get_suggest_inputs(self):
+        """ Texts indexed for search suggestions """
+        return [self.caption] if self.caption else []
+
+    def get_rendition(self, filter):  # pylint: disable=redefined-builtin
+        """
+        Look the rendition up in the prefetched renditions when they were loaded with
+        prefetch_related('renditions'), otherwise fall back to querying for it
+        """
+        if 'renditions' in getattr(self, '_prefetched_objects_cache', {}):
+            rendition_filter = Filter(spec=filter) if isinstance(filter, str) else filter
+            focal_point_key = rendition_filter.get_cache_key(self)
+            for rendition in self.renditions.all():
+                if rendition.filter_spec == rendition_filter.spec and rendition.focal_point_key == focal_point_key:
+                    return rendition
+
+        return super(JournalImage, self).get_rendition(filter)
+
 
 class JournalImageRendition(AbstractRendition):
     image = models.ForeignKey(JournalImage, related_name='renditions', on_delete=models.CASCADE)
@@ -377,6 +520,137 @@ class JournalImageRendition(AbstractRendition):
         )
 
 
+class VideoTranscript(models.Model):
+    '''
+    Local copy of a video transcript, compressed, with the validators of the response it was
+    read from, so that indexing videos doesn't download their transcripts and refreshing
+    them only downloads the ones which changed
+    '''
+    url = models.URLField(max_length=255, unique=True)
+    content = models.BinaryField()
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    checked_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.url
+
+    @property
+    def text(self):
+        return zlib.decompress(self.content).decode('utf-8')
+
+    @classmethod
+    def get_text(cls, url):
+        '''
+        Return the transcript at url, downloaded only if it isn't stored yet
+        '''
+        transcript = cls.objects.filter(url=url).first()
+        if transcript is None:
+            transcript, _ = cls.refresh(url)
+        return transcript.text if transcript else None
+
+    @classmethod
+    def refresh(cls, url, session=requests):
+        '''
+        Download the transcript at url if it changed since it was stored, with a conditional request
+        Args:
+            url: transcript url
+            session: requests session reused between transcripts
+        Returns:
+            (transcript, or None if it could never be read, whether it was downloaded)
+        '''
+        transcript = cls.objects.filter(url=url).first()
+        response = cls.download(url, session, transcript)
+        if response is None:
+            return transcript, False
+        if response.status_code == 304:
+            if transcript:
+                transcript.save(update_fields=['checked_at'])
+            return transcript, False
+        return cls.store(url, response), True
+
+    @classmethod
+    def refresh_many(cls, urls):
+        '''
+        Refresh the transcripts at urls like refresh, with the conditional requests sent from a pool
+        of threads over a shared session
+        Returns:
+            number of transcripts downloaded
+        '''
+        urls = set(urls)
+        transcripts = {transcript.url: transcript for transcript in cls.objects.filter(url__in=urls)}
+        session = get_prefetch_session()
+        responses = iter_concurrently(
+            lambda url: cls.download(url, session, transcripts.get(url)),
+            sorted(urls),
+            get_host=lambda url: urlsplit(url).netloc
+        )
+
+        downloaded = 0
+        unchanged_ids = []
+        for url, response in responses:
+            if response is None:
+                continue
+            if response.status_code == 304:
+                if url in transcripts:
+                    unchanged_ids.append(transcripts[url].id)
+            else:
+                cls.store(url, response)
+                downloaded += 1
+
+        if unchanged_ids:
+            cls.objects.filter(id__in=unchanged_ids).update(checked_at=timezone.now())
+        return downloaded
+
+    @classmethod
+    def prefetch(cls, urls):
+        '''
+        Download the transcripts at urls which aren't stored yet from a pool of threads, over a shared session
+        '''
+        urls = set(urls)
+        urls.difference_update(cls.objects.filter(url__in=urls).values_list('url', flat=True))
+        session = get_prefetch_session()
+        responses = iter_concurrently(
+            lambda url: cls.download(url, session), sorted(urls), get_host=lambda url: urlsplit(url).netloc
+        )
+        for url, response in responses:
+            if response is not None and response.status_code != 304:
+                cls.store(url, response)
+
+    @staticmethod
+    def download(url, session, transcript=None):
+        '''
+        Get the transcript at url, if it changed since transcript was stored when given,
+        without using the database
+        Returns:
+            the response, or None if the transcript couldn't be read
+        '''
+        headers = {}
+        if transcript and transcript.etag:
+            headers['If-None-Match'] = transcript.etag
+        if transcript and transcript.last_modified:
+            headers['If-Modified-Since'] = transcript.last_modified
+
+        try:
+            # No auth needed for transcripts
+            response = session.get(url, headers=headers, timeout=TRANSCRIPT_REQUEST_TIMEOUT)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as err:
+            logger.error('Exception trying to download transcript url={url} err={err}'.format(url=url, err=err))
+            return None
+        return response
+
+    @classmethod
+    def store(cls, url, response):
+        ''' Store the transcript downloaded from url with its validators '''
+        transcript, _ = cls.objects.update_or_create(url=url, defaults={
+            'content': zlib.compress(response.content),
+            'etag': response.headers.get('ETag', ''),
+            'last_modified': response.headers.get('Last-Modified', ''),
+        })
+        return transcript
+
+
 class VideoQuerySet(SearchableQuerySetMixin, models.QuerySet):
     pass
 
@@ -404,6 +678,7 @@ class Video(CollectionMember, index.Indexed, models.Model):
         ]),
         index.FilterField('id'),
         index.FilterField('source_course_run'),
+        index.FilterField('journal_ids'),
     ]
 
     def get_action_url_name(self, action):
@@ -412,32 +687,57 @@ class Video(CollectionMember, index.Indexed, models.Model):
     def get_usage(self):
         return JournalPage.objects.filter(videos=self)
 
+    def journal_ids(self):
+        """ Ids of the journals with a live and public page showing this video """
+        return JournalPage.get_public_journal_ids(self.journalpage_set.all())
+
+    def get_suggest_inputs(self):
+        """ Texts indexed for search suggestions """
+        return [self.display_name]
+
+    @classmethod
+    def prefetch_search_payloads(cls, videos):
+        '''
+        Download the transcripts of videos not stored yet concurrently, so that indexing
+        them only reads the transcript store
+        '''
+        VideoTranscript.prefetch(video.transcript_url for video in videos if video.transcript_url)
+
     def transcript(self):
         '''
-        Read the transcript from the transcript url to provide
-        to elasticsearch
+        Read the transcript from the local transcript store, downloaded from the
+        transcript url only if it was never stored, to provide to elasticsearch
         '''
         if not self.transcript_url:
             return None
 
         try:
-            response = requests.get(self.transcript_url)  # No auth needed for transcripts
-            contents = response.content
-            return contents.decode('utf-8')[:settings.MAX_ELASTICSEARCH_UPLOAD_SIZE] if contents else None
+            contents = VideoTranscript.get_text(self.transcript_url)
+            return contents[:settings.MAX_ELASTICSEARCH_UPLOAD_SIZE] if contents else None
         except Exception as err:  # pylint: disable=broad-except
             logger.error(
                 'Exception trying to read transcript url={url} for Video err={err}'.format(
                     url=self.transcript_url, err=err))
             return None
 
+    def get_journal_uuid(self):
+        """
+        Uuid of the journal of the first live page the video is published in, read from the
+        VideoJournal lookup. No query is made when video_journals were prefetched.
+        """
+        if 'video_journals' in getattr(self, '_prefetched_objects_cache', {}):
+            video_journals = sorted(self.video_journals.all(), key=lambda video_journal: video_journal.journal_page_id)
+            return video_journals[0].journal_uuid if video_journals else None
+
+        return self.video_journals.order_by('journal_page_id').values_list('journal_uuid', flat=True).first()
+
     @property
     def view_access_url(self):
         '''
         Return the url to access the video on LMS based on the Journal that the video
         is found in.
         '''
-        journal_page = JournalPage.objects.filter(videos=self).live().distinct().first()
-        journal_uuid = journal_page.get_journal().uuid if journal_page else 0
+        journal_uuid = self.get_journal_uuid() or 0
 
         url = self.view_url.replace(
             "xblock",
@@ -457,7 +757,7 @@ class Video(CollectionMember, index.Indexed, models.Model):
 from .blocks import (
     JournalRichTextBlock, JournalImageChooserBlock, JournalRawHTMLBlock, PDFBlock, XBlockVideoBlock,
     PDF_BLOCK_TYPE, VIDEO_BLOCK_TYPE, IMAGE_BLOCK_TYPE, RICH_TEXT_BLOCK_TYPE, RAW_HTML_BLOCK_TYPE,
-    STREAM_DATA_DOC_FIELD, STREAM_DATA_TYPE_FIELD)  # noqa
+    STREAM_DATA_DOC_FIELD, STREAM_DATA_IMAGE_FIELD, STREAM_DATA_TYPE_FIELD, STREAM_DATA_VIDEO_FIELD)  # noqa
 
 
 class JournalRichTextField(RichTextField):
@@ -646,6 +946,12 @@ class JournalAboutPage(JournalPageMixin, Page):
 
         return get_image_url(self.site, self.card_image)
 
+    def get_link_ids(self):
+        """
+        Return a dict of link type to the ids of the objects the API representation of this page uses
+        """
+        return {'image': {str(image_id) for image_id in (self.card_image_id, self.hero_image_id) if image_id}}
+
     @property
     def card_image_absolute_url(self):
         if not self.card_image:
@@ -667,20 +973,103 @@ class JournalAboutPage(JournalPageMixin, Page):
 
     @property
     def structure(self):
-        """ Returns hierarchy of published journal pages as a dict """
-        journal_structure = [
-            struct for struct in
-            (
-                journal_page.specific.get_nested_children(live_only=True)
-                for journal_page in self.get_children()
-                if self.get_descendants().live().count() > 0
-            )
-            if struct is not None
-        ]
-        journal_structure = self.flatten_children(journal_structure)
+        """
+        Returns hierarchy of published journal pages as a dict
+
+        The hierarchy is cached per about page and keyed by the latest publish/unpublish
+        of a page in this journal, so it is only rebuilt after the journal changes.
+        """
+        cache_key = get_cache_key(
+            resource='journal_structure',
+            journal_about_id=self.id,
+            published=self.get_published_stamp(self.id),
+        )
+
+        journal_structure = cache.get(cache_key)
+        if journal_structure is None:
+            journal_structure = self.build_structure()
+            cache.set(cache_key, journal_structure, JOURNAL_STRUCTURE_CACHE_TIMEOUT)
 
         return journal_structure
 
+    @staticmethod
+    def _get_published_stamp_key(journal_about_id):
+        return get_cache_key(resource='journal_structure_published', journal_about_id=journal_about_id)
+
+    @classmethod
+    def get_published_stamp(cls, journal_about_id):
+        """
+        Return the stamp of the latest publish/unpublish in the journal of the given about page.
+        Caches of content derived from the whole journal are keyed by this stamp.
+        """
+        stamp_key = cls._get_published_stamp_key(journal_about_id)
+        return get_cache_stamps([stamp_key])[stamp_key]
+
+    def invalidate_structure(self):
+        """
+        Called when a page in this journal is published or unpublished, so the next request rebuilds the structure
+        """
+        touch_cache_stamps([self._get_published_stamp_key(self.id)])
+
+    @staticmethod
+    def _get_search_generation_key(journal_about_id):
+        return get_cache_key(resource='journal_search_generation', journal_about_id=journal_about_id)
+
+    @classmethod
+    def get_search_generations(cls, journal_about_ids):
+        """
+        Return a dict of about page id to the generation of the searchable content of its journal.
+        Cached search results are keyed by the generations of the journals searched, so they
+        expire when content in any of them changes.
+        """
+        keys = {cls._get_search_generation_key(journal_about_id): journal_about_id
+                for journal_about_id in journal_about_ids}
+        generations = get_cache_stamps(keys)
+        return {keys[key]: generation for key, generation in generations.items()}
+
+    @classmethod
+    def invalidate_search_results(cls, journal_about_ids):
+        """
+        Called when pages or media of these journals change, so searches in them run again
+        """
+        touch_cache_stamps([cls._get_search_generation_key(journal_about_id) for journal_about_id in journal_about_ids])
+
+    def build_structure(self):
+        """ Builds hierarchy of published journal pages as a dict """
+        return self.get_nested_descendants(live_only=True)
+
+    def update_reading_order(self):
+        """
+        Rank the live pages of this journal in depth-first reading order, which is the
+        order of their treebeard path, so previous/next navigation is a single indexed lookup.
+        Pages that are not live have no rank. Only pages whose rank changed are updated.
+        """
+        changed_pages = {}
+        rank = 0
+        pages = JournalPage.objects.descendant_of(self).order_by('path').values_list('id', 'live', 'reading_order')
+        for page_id, live, reading_order in pages:
+            new_reading_order = rank if live else None
+            if live:
+                rank += 1
+            if new_reading_order != reading_order:
+                changed_pages[page_id] = new_reading_order
+
+        unranked_page_ids = [page_id for page_id, page_rank in changed_pages.items() if page_rank is None]
+        if unranked_page_ids:
+            JournalPage.objects.filter(page_ptr_id__in=unranked_page_ids).update(reading_order=None)
+
+        ranked_pages = [(page_id, page_rank) for page_id, page_rank in changed_pages.items() if page_rank is not None]
+        for start in range(0, len(ranked_pages), READING_ORDER_UPDATE_BATCH_SIZE):
+            batch = ranked_pages[start:start + READING_ORDER_UPDATE_BATCH_SIZE]
+            JournalPage.objects.filter(
+                page_ptr_id__in=[page_id for page_id, _ in batch]
+            ).update(
+                reading_order=Case(
+                    *[When(page_ptr_id=page_id, then=Value(page_rank)) for page_id, page_rank in batch],
+                    output_field=models.PositiveIntegerField()
+                )
+            )
+
     def get_frontend_page_path(self):
         return '{about_page_id}/about'.format(about_page_id=self.id)
 
@@ -728,6 +1117,12 @@ class JournalIndexPage(JournalPageMixin, Page):
         else:
             return ''
 
+    def get_link_ids(self):
+        """
+        Return a dict of link type to the ids of the objects the API representation of this page uses
+        """
+        return {'image': {str(self.hero_image_id)} if self.hero_image_id else set()}
+
     @property
     def site(self):
         about_page = self.get_first_child()
@@ -777,6 +1172,9 @@ class JournalPage(JournalPageMixin, Page):
     videos = models.ManyToManyField(Video)
     documents = models.ManyToManyField(JournalDocument)
 
+    # rank of the page in the depth-first reading order of its journal, None when the page is not live
+    reading_order = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
     content_panels = Page.content_panels + [
         FieldPanel('sub_title'),
         FieldPanel('display_last_published_date'),
@@ -788,9 +1186,15 @@ class JournalPage(JournalPageMixin, Page):
         index.SearchField('body', partial_match=True),
         index.SearchField('sub_title', partial_match=True),
         index.SearchField('author', partial_match=True),
-        index.SearchField('search_description', partial_match=True)
+        index.SearchField('search_description', partial_match=True),
+        index.FilterField('journal_ids'),
     ]
 
+    class Meta:
+        index_together = (
+            ('journal_about_page', 'reading_order'),
+        )
+
     api_fields = [
         APIField('sub_title'),
         APIField('display_last_published_date'),
@@ -802,6 +1206,11 @@ class JournalPage(JournalPageMixin, Page):
         APIField('next_page_id'),
     ]
 
+    def __init__(self, *args, **kwargs):
+        super(JournalPage, self).__init__(*args, **kwargs)
+        # bread crumbs resolved in bulk by prefetch_bread_crumbs, or on first access
+        self._bread_crumbs = None
+
     def update_related_objects(self, clear=False):
         """
         Update the relationship of related objects (docs, videos)
@@ -814,11 +1223,83 @@ class JournalPage(JournalPageMixin, Page):
             new_videos = set()
             new_images = set()
 
+        old_components = set(self.documents.all()) | set(self.videos.all()) | set(self.images.all())
+
         self.documents.set(new_docs)  # pylint: disable=no-member
         self.videos.set(new_videos)  # pylint: disable=no-member
         self.images.set(new_images)  # pylint: disable=no-member
         self.journal_about_page = self._calculate_journal_about_page()
         self.save()
+        VideoJournal.set_page_videos(self, new_videos)
+
+        # the journal ids indexed with the components this page started or stopped using have changed
+        update_search_index(old_components ^ (new_docs | new_videos | new_images))
+
+    def get_link_ids(self):
+        """
+        Return a dict of link type to the ids of the pages, documents, images and videos
+        the body links to or embeds, read from the raw stream data without any query
+        """
+        link_ids = {'page': set(), 'document': set(), 'image': set(), 'video': set()}
+        chooser_fields = {
+            PDF_BLOCK_TYPE: ('document', STREAM_DATA_DOC_FIELD),
+            IMAGE_BLOCK_TYPE: ('image', STREAM_DATA_IMAGE_FIELD),
+            VIDEO_BLOCK_TYPE: ('video', STREAM_DATA_VIDEO_FIELD),
+        }
+
+        for data in self.body.stream_data:  # pylint: disable=no-member
+            block_type = data.get(STREAM_DATA_TYPE_FIELD, None)
+            value = data.get('value')
+            if block_type == RICH_TEXT_BLOCK_TYPE and value:
+                for link_type, object_ids in JournalRichTextBlock.get_link_ids(value).items():
+                    link_ids[link_type] |= object_ids
+            elif block_type in chooser_fields and value and value.get(chooser_fields[block_type][1]):
+                link_type, field_name = chooser_fields[block_type]
+                link_ids[link_type].add(str(value[field_name]))
+
+        return link_ids
+
+    def journal_ids(self):
+        """
+        Id of the journal of this page as a list, indexed like the journal ids of
+        documents, images and videos so all searches filter the same way
+        """
+        journal_about_page = self.get_journal_about_page()
+        if not journal_about_page or not journal_about_page.journal_id:
+            return []
+        return [journal_about_page.journal_id]
+
+    def get_suggest_inputs(self):
+        """
+        Texts indexed for search suggestions, none unless the page is live and public
+        """
+        if not self.live or self.get_view_restrictions().exists():
+            return []
+        return [text for text in (self.title, self.sub_title, self.author) if text]
+
+    @staticmethod
+    def get_public_journal_ids(journal_pages):
+        """
+        Get the sorted ids of the journals of the live and public pages among journal_pages
+        """
+        return sorted(set(
+            journal_pages.live().public().filter(
+                journal_about_page__journal__isnull=False
+            ).values_list('journal_about_page__journal_id', flat=True)
+        ))
+
+    @classmethod
+    def update_search_index_with_components(cls, journal_pages):
+        """
+        Reindex journal_pages and the documents, images and videos they use, after the
+        journal or the visibility of the pages changed
+        """
+        update_search_index(itertools.chain(
+            journal_pages,
+            JournalDocument.objects.filter(journalpage__in=journal_pages).distinct(),
+            JournalImage.objects.filter(journalpage__in=journal_pages).distinct(),
+            Video.objects.filter(journalpage__in=journal_pages).distinct(),
+        ))
 
     def _get_related_objects(self, documents=True, videos=True, images=True):
         """
@@ -847,62 +1328,97 @@ class JournalPage(JournalPageMixin, Page):
         """
         Get the ordered list of live ancestors to this page.
         """
-        if title_only:
-            ancestors = self.get_ancestors().live().filter(
-                content_type=self.content_type).values_list('title', flat=True)
-        else:
-            ancestors = self.get_ancestors().live().filter(content_type=self.content_type).values('title', 'id')
+        return self.get_bread_crumbs_for_pages([self], title_only=title_only)[self.id]
 
-        return ancestors
-
-    def get_prev_page(self, live_only=True):
+    @classmethod
+    def get_bread_crumbs_for_pages(cls, pages, title_only=False):
         """
-        Get the previous page for navigation. Search order is previous sibling's last descendant,
-        previous sibling, then parent
+        Get the ordered list of live JournalPage ancestors for many pages at once.
+        The ancestor paths are decoded from each page's treebeard path so every
+        ancestor is loaded in a single query.
+        Returns:
+            dict of page id to list of ancestor titles (title_only) or {'title', 'id'} dicts
         """
-        prev_sib = self.get_prev_siblings().first()
-        if prev_sib:
-            last_child = prev_sib.specific.get_last_descendant(live_only=live_only)
-            return last_child if last_child else prev_sib
-
-        prev_ancestor = self.get_ancestors().last()
-        if prev_ancestor and isinstance(prev_ancestor.specific, JournalPage):
-            if prev_ancestor.specific.live or not live_only:
-                return prev_ancestor
-            return prev_ancestor.specific.get_prev_page(live_only=live_only)
-        return None
+        ancestor_paths = {
+            page.id: [page.path[:Page.steplen * depth] for depth in range(1, page.depth)]
+            for page in pages
+        }
+        all_ancestor_paths = set(path for paths in ancestor_paths.values() for path in paths)
+
+        ancestors = {}
+        if all_ancestor_paths:
+            ancestors = {
+                ancestor['path']: ancestor for ancestor in Page.objects.filter(
+                    path__in=all_ancestor_paths,
+                    content_type=ContentType.objects.get_for_model(cls),
+                ).live().values('path', 'title', 'id')
+            }
+
+        bread_crumbs = {}
+        for page_id, paths in ancestor_paths.items():
+            page_ancestors = [ancestors[path] for path in paths if path in ancestors]
+            if title_only:
+                bread_crumbs[page_id] = [ancestor['title'] for ancestor in page_ancestors]
+            else:
+                bread_crumbs[page_id] = [
+                    {'title': ancestor['title'], 'id': ancestor['id']} for ancestor in page_ancestors
+                ]
+
+        return bread_crumbs
 
-    def get_next_page(self, children_and_sibs=True, live_only=True):
+    @classmethod
+    def prefetch_bread_crumbs(cls, pages):
         """
-        Get the next page for navigation. Search order is child, sibling then
-        parent next sibling recursively
+        Resolve the bread crumbs of the given pages in bulk so serializing
+        their bread_crumbs field needs no further queries
         """
-        if children_and_sibs:
-            next_child = self.get_descendants().live().first() if live_only else self.get_descendants().first()
-            if next_child:
-                return next_child
+        bread_crumbs = cls.get_bread_crumbs_for_pages(pages)
+        for page in pages:
+            page._bread_crumbs = bread_crumbs[page.id]  # pylint: disable=protected-access
 
-            next_sib = self.get_next_sibling()
-            if next_sib:
-                if next_sib.live or not live_only:
-                    return next_sib
-                return next_sib.specific.get_next_page(children_and_sibs=True, live_only=live_only)
+    def get_prev_page(self, live_only=True):
+        """
+        Get the previous page for navigation, i.e. the closest live page before this one
+        in the depth-first reading order of the journal
+        """
+        if live_only and self._has_reading_order():
+            return JournalPage.objects.filter(
+                journal_about_page_id=self.journal_about_page_id,
+                reading_order__lt=self.reading_order
+            ).order_by('-reading_order').first()
 
-        #  no direct children or siblings, now lets recursively check parent's siblings
-        parent = self.get_parent()
-        if not isinstance(parent.specific, JournalPage):
-            return None
-        next_sib = parent.get_next_sibling()
+        return self._get_journal_pages(live_only).filter(path__lt=self.path).order_by('-path').first()
 
-        if next_sib:
-            if next_sib.live or not live_only:
-                return next_sib
-            return next_sib.specific.get_next_page(children_and_sibs=True, live_only=live_only)
-        return parent.specific.get_next_page(children_and_sibs=False, live_only=True)
+    def get_next_page(self, live_only=True):
+        """
+        Get the next page for navigation, i.e. the closest live page after this one
+        in the depth-first reading order of the journal
+        """
+        if live_only and self._has_reading_order():
+            return JournalPage.objects.filter(
+                journal_about_page_id=self.journal_about_page_id,
+                reading_order__gt=self.reading_order
+            ).order_by('reading_order').first()
+
+        return self._get_journal_pages(live_only).filter(path__gt=self.path).order_by('path').first()
+
+    def _has_reading_order(self):
+        """ Pages that are not live, or not ranked yet, fall back to a lookup on the treebeard path """
+        return self.reading_order is not None and self.journal_about_page_id is not None
+
+    def _get_journal_pages(self, live_only=True):
+        """ The pages of the journal of this page, none for a page outside of a journal """
+        journal_about_page = self.get_journal_about_page()
+        if not journal_about_page:
+            return JournalPage.objects.none()
+        journal_pages = JournalPage.objects.descendant_of(journal_about_page)
+        return journal_pages.live() if live_only else journal_pages
 
     @property
     def bread_crumbs(self):
-        return self.get_bread_crumbs()
+        if self._bread_crumbs is None:
+            self._bread_crumbs = self.get_bread_crumbs()
+        return self._bread_crumbs
 
     @property
     def previous_page_id(self):
@@ -914,18 +1430,9 @@ class JournalPage(JournalPageMixin, Page):
         page = self.get_next_page()
         return page.id if page else None
 
-    def get_last_descendant(self, live_only=True):
-        """
-        get the last descendant of this page
-        """
-        if live_only:
-            return self.get_descendants().live().last()
-        else:
-            return self.get_descendants().last()
-
     def get_frontend_page_path(self):
         return '{about_page_id}/pages/{page_id}'.format(
-            about_page_id=self.get_journal_about_page().id,
+            about_page_id=self.journal_about_page_id or self.get_journal_about_page().id,
             page_id=self.id
         )
 
@@ -954,30 +1461,23 @@ class JournalPage(JournalPageMixin, Page):
         return journal_about.journal
 
     def get_journal_about_page(self):
-        """ Gets the journal about page field and calculates it if null """
-        if not self.journal_about_page:
+        """
+        Gets the journal about page field and calculates it if null.
+        The calculated value is not saved here, as this is called while serving
+        requests, it is persisted when the page is published (see update_related_objects)
+        or by the update_journal_about_pages management command.
+        """
+        if not self.journal_about_page_id:
             self.journal_about_page = self._calculate_journal_about_page()
-            # only save if page has been published otherwise saving causes
-            # page to be published which causes a problem for preview use-case
-            if self.page_ptr_id:
-                self.save()
 
         return self.journal_about_page
 
     def _calculate_journal_about_page(self):
-        """return about_page for journal"""
-        journal_about = None
-        parent = self.get_parent()
-        journal_about = parent.specific
-        while True:
-            if isinstance(parent.specific, JournalAboutPage):
-                journal_about = parent.specific
-                break
-            try:
-                parent = parent.get_parent()
-            except:  # noqa pylint: disable=bare-except
-                logging.error("Cannot find parent of {}".format(self))
-                break
+        """return about_page for journal, found among the ancestors encoded in the page's treebeard path"""
+        ancestor_paths = [self.path[:self.steplen * depth] for depth in range(1, self.depth)]
+        journal_about = JournalAboutPage.objects.filter(path__in=ancestor_paths).order_by('-depth').first()
+        if not journal_about:
+            logger.error("Cannot find journal about page of {}".format(self))
         return journal_about
 
     def get_journal_structure(self):
@@ -992,6 +1492,51 @@ class JournalPage(JournalPageMixin, Page):
         return json.dumps(self.get_journal_structure())
 
 
+class VideoJournal(models.Model):
+    """
+    Lookup of the journal each video is published in, one row per live JournalPage using the video.
+    Maintained when pages are published, unpublished or moved, so the journal of a video
+    can be found without walking its pages.
+    """
+    video = models.ForeignKey(Video, related_name='video_journals', on_delete=models.CASCADE)
+    journal_page = models.ForeignKey(JournalPage, related_name='video_journals', on_delete=models.CASCADE)
+    journal_uuid = models.UUIDField(db_index=True)
+
+    class Meta:
+        unique_together = (
+            ('video', 'journal_page'),
+        )
+
+    @classmethod
+    def set_page_videos(cls, journal_page, videos):
+        """ Replaces the rows of journal_page with the given videos, called when the page is (un)published """
+        old_video_ids = list(cls.objects.filter(journal_page=journal_page).values_list('video_id', flat=True))
+        cls.objects.filter(journal_page=journal_page).delete()
+        # the view url of a video carries the journal of the first page it is published in
+        JournalRichTextBlock.invalidate_expanded_html('video', set(old_video_ids) | {video.id for video in videos})
+
+        journal_about_page = journal_page.journal_about_page
+        # about pages lose their journal when it's deleted
+        if not videos or not journal_about_page or journal_about_page.journal_id is None:
+            return
+
+        journal_uuid = journal_about_page.journal.uuid
+        cls.objects.bulk_create([
+            cls(video=video, journal_page=journal_page, journal_uuid=journal_uuid)
+            for video in videos
+        ])
+
+    @classmethod
+    def set_pages_journal(cls, journal_pages, journal_about_page):
+        """ Points the rows of the given JournalPage queryset at journal_about_page, called when pages move """
+        video_journals = cls.objects.filter(journal_page__in=journal_pages)
+        JournalRichTextBlock.invalidate_expanded_html('video', set(video_journals.values_list('video_id', flat=True)))
+        if journal_about_page and journal_about_page.journal_id is not None:
+            video_journals.update(journal_uuid=journal_about_page.journal.uuid)
+        else:
+            video_journals.delete()
+
+
 class WagtailModelManager(object):
     """
     Class to have utility methods for wagtail models
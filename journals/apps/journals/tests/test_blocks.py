@@ -2,10 +2,30 @@
 """
 Tests for custom blocks
 """
+import uuid
+
 import ddt
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from wagtail.wagtailcore.models import Site
+from wagtail.wagtailimages.models import Filter
 
-from journals.apps.journals.blocks import JournalRawHTMLBlock
+from journals.apps.core.tests.factories import (
+    DocumentFactory,
+    ImageFactory,
+    JournalFactory,
+    OrganizationFactory,
+    VideoFactory
+)
+from journals.apps.core.tests.utils import TEST_JOURNAL_STRUCTURE, create_journal_about_page_factory
+from journals.apps.journals.blocks import (
+    IMAGE_BLOCK_TYPE,
+    PDF_BLOCK_TYPE,
+    VIDEO_BLOCK_TYPE,
+    JournalRawHTMLBlock,
+    JournalRichTextBlock
+)
+from journals.apps.journals.models import JournalImageRendition, JournalPage
 
 
 @ddt.ddt
@@ -42,3 +62,137 @@ class TestJournalRawHTMLBlock(TestCase):
         Test value of this block is properly cleaned before being saved
         """
         self.assertEqual(self.block.value_for_form(given_value), transformed_value)
+
+
+class TestBulkChooserStructBlock(TestCase):
+    """
+    Tests for loading the media referenced by a page body in bulk
+    """
+    def setUp(self):
+        super(TestBulkChooserStructBlock, self).setUp()
+        self.images = [ImageFactory() for _ in range(3)]
+        self.documents = [DocumentFactory() for _ in range(3)]
+        self.videos = [VideoFactory(block_id=uuid.uuid4()) for _ in range(3)]
+        for image in self.images:
+            JournalImageRendition.objects.create(
+                image=image,
+                filter_spec='original',
+                focal_point_key=Filter(spec='original').get_cache_key(image),
+                file='original_images/{}.png'.format(image.id),
+                width=image.width,
+                height=image.height,
+            )
+
+    def test_stream_media_loaded_in_bulk(self):
+        """
+        Every document, video and image in a body is loaded with one query per type
+        """
+        stream_data = []
+        for image, document, video in zip(self.images, self.documents, self.videos):
+            stream_data.append({'type': IMAGE_BLOCK_TYPE, 'value': {'image': image.id, 'title': ''}})
+            stream_data.append({'type': PDF_BLOCK_TYPE, 'value': {'doc': document.id, 'title': ''}})
+            stream_data.append({'type': VIDEO_BLOCK_TYPE, 'value': {'video': video.id, 'title': ''}})
+        stream_data.append({'type': PDF_BLOCK_TYPE, 'value': {'doc': 0, 'title': 'deleted'}})
+        body = JournalPage._meta.get_field('body').stream_block.to_python(stream_data)
+
+        # documents, videos and their journals, images and their renditions
+        with self.assertNumQueries(5):
+            images = [child.value['image'] for child in body if child.block_type == IMAGE_BLOCK_TYPE]
+            documents = [child.value['doc'] for child in body if child.block_type == PDF_BLOCK_TYPE]
+            videos = [child.value['video'] for child in body if child.block_type == VIDEO_BLOCK_TYPE]
+            renditions = [image.get_rendition('original') for image in images]
+
+        self.assertEqual(images, self.images)
+        self.assertEqual(documents, self.documents + [None])
+        self.assertEqual(videos, self.videos)
+        self.assertEqual([rendition.image_id for rendition in renditions], [image.id for image in self.images])
+
+
+class TestJournalRichTextBlock(TestCase):
+    """
+    Tests for JournalRichTextBlock
+    """
+    def setUp(self):
+        super(TestJournalRichTextBlock, self).setUp()
+        cache.clear()
+        self.site = Site.objects.first()
+        self.journal_about_page = create_journal_about_page_factory(
+            journal=JournalFactory(organization=OrganizationFactory(site=self.site)),
+            journal_structure=TEST_JOURNAL_STRUCTURE,
+            root_page=self.site.root_page,
+        )
+        self.pages = list(JournalPage.objects.all())
+        self.documents = [DocumentFactory() for _ in range(3)]
+        self.html = ''.join(
+            ['<p><a linktype="page" id="{}">page</a></p>'.format(page.id) for page in self.pages] +
+            ['<p><a linktype="document" id="{}">doc</a></p>'.format(doc.id) for doc in self.documents] +
+            ['<p><a linktype="document" id="0">deleted doc</a></p>']
+        )
+        self.request = RequestFactory().get('/')
+        self.request.site = self.site
+
+    def test_expand_db_html_resolves_links_in_bulk(self):
+        """
+        Links are resolved with one query per link type, whatever the number of links
+        """
+        # pages, their specific JournalPages and documents
+        with self.assertNumQueries(3):
+            html = JournalRichTextBlock.expand_db_html(self.html, base_url='http://testserver/')
+
+        for page in self.pages:
+            self.assertIn('<a href="{}">'.format(page.get_frontend_page_path()), html)
+        for doc in self.documents:
+            self.assertIn('<a href="{}" target="_blank">'.format(doc.get_viewer_url('http://testserver/')), html)
+        self.assertIn('<a>deleted doc</a>', html)
+
+    def test_expanded_html_is_cached(self):
+        """
+        The expanded html is cached until a link target changes
+        """
+        block = JournalRichTextBlock()
+        value = block.to_python(self.html)
+        html = block.get_api_representation(value, context={'request': self.request})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(block.get_api_representation(value, context={'request': self.request}), html)
+
+        self.documents[0].delete()
+        with self.assertNumQueries(3):
+            html = block.get_api_representation(value, context={'request': self.request})
+        self.assertNotIn(self.documents[0].get_viewer_url('http://testserver/'), html)
+
+    def test_expanded_html_invalidated_per_link(self):
+        """
+        Only the expanded html linking to or embedding a changed object is expanded again
+        """
+        image = ImageFactory()
+        JournalImageRendition.objects.create(
+            image=image,
+            filter_spec='width-800',
+            focal_point_key=Filter(spec='width-800').get_cache_key(image),
+            file='images/{}.png'.format(image.id),
+            width=image.width,
+            height=image.height,
+        )
+        block = JournalRichTextBlock()
+        value = block.to_python(self.html)
+        embed_value = block.to_python(
+            '<embed embedtype="image" id="{}" format="fullwidth" alt="image"/>'.format(image.id)
+        )
+        block.get_api_representation(value, context={'request': self.request})
+        block.get_api_representation(embed_value, context={'request': self.request})
+
+        # a document or image not linked from the rich text changes
+        DocumentFactory()
+        ImageFactory()
+        with self.assertNumQueries(0):
+            block.get_api_representation(value, context={'request': self.request})
+            block.get_api_representation(embed_value, context={'request': self.request})
+
+        image.title = 'renamed'
+        image.save()
+        with self.assertNumQueries(0):
+            block.get_api_representation(value, context={'request': self.request})
+        # the image and its rendition
+        with self.assertNumQueries(2):
+            block.get_api_representation(embed_value, context={'request': self.request})
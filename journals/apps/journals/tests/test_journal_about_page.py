@@ -1,9 +1,11 @@
 """
 Test Cases for journal about page
 """
+from django.core.cache import cache
+from django.db.models.signals import pre_delete
 from django.test import TestCase
 from django.urls import reverse
-from wagtail.wagtailcore.models import Site
+from wagtail.wagtailcore.models import Page, Site
 
 from journals.apps.core.tests.factories import (
     JournalFactory,
@@ -18,7 +20,9 @@ from journals.apps.core.tests.utils import (
 from journals.apps.journals.handlers import (
     connect_page_signals_handlers,
     disconnect_page_signals_handlers,
+    page_unpub_receiver,
 )
+from journals.apps.journals.models import JournalAboutPage, JournalPage
 
 
 class TestJournalAboutPageStructure(TestCase):
@@ -36,6 +40,7 @@ class TestJournalAboutPageStructure(TestCase):
 
     def setUp(self):
         super(TestJournalAboutPageStructure, self).setUp()
+        cache.clear()
 
         self.user = UserFactory()
         self.user.is_superuser = True
@@ -172,3 +177,69 @@ class TestJournalAboutPageStructure(TestCase):
         self.journal_about_page.get_children()[0].get_children()[0].unpublish()
         self.journal_about_page.get_children()[0].get_children()[0].get_children()[0].save_revision().publish()
         self._assert_page_hierarchy()
+
+    def test_structure_is_cached(self):
+        """
+        Tests journal about page structure is served from cache until a page in the journal is unpublished
+        """
+        structure = self.journal_about_page.structure
+        self.assertEqual([child['title'] for child in structure], ['test_page_1', 'test_page_2', 'test_page_3'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.journal_about_page.structure, structure)
+
+        # unpublishing without the signal firing keeps serving the cached structure
+        journal_page = JournalPage.objects.get(title='test_page_2')
+        JournalPage.objects.filter(id=journal_page.id).update(live=False)
+        self.assertEqual(self.journal_about_page.structure, structure)
+
+        journal_page.live = False
+        page_unpub_receiver(sender=JournalPage, instance=journal_page)
+        self.assertEqual(
+            [child['title'] for child in self.journal_about_page.structure],
+            ['test_page_1', 'test_page_3']
+        )
+
+    def test_structure_invalidated_on_delete(self):
+        """
+        Tests the structure is rebuilt without a deleted page once it is deleted, even when it was
+        requested again while the page was being deleted
+        """
+        connect_page_signals_handlers()
+        self.addCleanup(disconnect_page_signals_handlers)
+        structure = self.journal_about_page.structure
+        self.assertEqual([child['title'] for child in structure], ['test_page_1', 'test_page_2', 'test_page_3'])
+
+        def request_structure(sender, **kwargs):  # pylint: disable=unused-argument
+            return JournalAboutPage.objects.get(id=self.journal_about_page.id).structure
+
+        # wagtail unpublishes pages before deleting them, while they are still in the database
+        pre_delete.connect(request_structure, sender=Page)
+        self.addCleanup(pre_delete.disconnect, request_structure, sender=Page)
+        JournalPage.objects.get(title='test_page_3').delete()
+        self.assertEqual(
+            [child['title'] for child in self.journal_about_page.structure],
+            ['test_page_1', 'test_page_2']
+        )
+
+    def test_structure_flattens_unpublished_pages(self):
+        """
+        Tests unpublished pages are replaced by their published children, built in a single query
+        """
+        JournalPage.objects.filter(title__in=['test_page_1', 'test_page_1_child_1']).update(live=False)
+        JournalPage.objects.filter(title='test_page_3_child_2').update(live=False)
+        Site.get_site_root_paths()  # page urls are resolved from the cached site root paths
+
+        with self.assertNumQueries(1):
+            structure = self.journal_about_page.build_structure()
+
+        def titles(nodes):
+            return [(node['title'], titles(node['children']) if node['children'] else None) for node in nodes]
+
+        self.assertEqual(titles(structure), [
+            ('test_page_1_grand_child_1', None),
+            ('test_page_1_grand_child_2', None),
+            ('test_page_1_child_2', None),
+            ('test_page_2', None),
+            ('test_page_3', [('test_page_3_child_1', None)]),
+        ])
@@ -1,5 +1,8 @@
 """ Test Cases for Journal Page """
+import uuid
+from unittest import mock
 
+from django.core import management
 from django.test import TestCase
 from django.urls import reverse
 from wagtail.wagtailcore.models import Site
@@ -9,9 +12,11 @@ from journals.apps.core.tests.factories import (
     OrganizationFactory,
     JournalFactory,
     SiteConfigurationFactory,
+    VideoFactory,
     USER_PASSWORD
 )
-from journals.apps.journals.models import JournalPage
+from journals.apps.journals.blocks import VIDEO_BLOCK_TYPE, JournalRichTextBlock
+from journals.apps.journals.models import JournalAboutPage, JournalPage, Video, VideoJournal
 from journals.apps.core.tests.utils import (
     create_journal_about_page_factory,
 )
@@ -366,3 +371,185 @@ class TestJournalPage(TestCase):
             self._get_previous_page(journal_grand_child_pages[0]).title,
             "test_page_1_child_1"
         )
+
+    def test_reading_order_navigation(self):
+        """
+        Test previous/next navigation uses the reading order of live pages
+        """
+        JournalPage.objects.filter(title='test_page_1_grand_child_1').update(live=False)
+        self.journal_about_page.update_reading_order()
+
+        ranked_titles = list(JournalPage.objects.filter(
+            reading_order__isnull=False
+        ).order_by('reading_order').values_list('title', flat=True))
+        self.assertEqual(ranked_titles, [
+            'test_page_1',
+            'test_page_1_child_1',
+            'test_page_1_grand_child_1_grand_child_1',
+            'test_page_1_grand_child_1_grand_child_1_grand_child_1',
+            'test_page_1_grand_child_1_grand_child_2',
+            'test_page_1_grand_child_2',
+        ])
+
+        page = JournalPage.objects.get(title='test_page_1_grand_child_1_grand_child_1')
+        with self.assertNumQueries(1):
+            self.assertEqual(page.get_prev_page().title, 'test_page_1_child_1')
+        with self.assertNumQueries(1):
+            self.assertEqual(page.get_next_page().title, 'test_page_1_grand_child_1_grand_child_1_grand_child_1')
+
+        # unpublished pages are not ranked but still navigate to their closest live pages
+        page = JournalPage.objects.get(title='test_page_1_grand_child_1')
+        self.assertIsNone(page.reading_order)
+        self.assertEqual(page.get_prev_page().title, 'test_page_1_child_1')
+        self.assertEqual(page.get_next_page().title, 'test_page_1_grand_child_1_grand_child_1')
+
+        self.assertIsNone(JournalPage.objects.get(title='test_page_1').get_prev_page())
+        self.assertIsNone(JournalPage.objects.get(title='test_page_1_grand_child_2').get_next_page())
+
+    def test_reading_order_updated_on_move(self):
+        """
+        Test moving a page rebuilds the reading order of the journal
+        """
+        self.journal_about_page.update_reading_order()
+        page = JournalPage.objects.get(title='test_page_1_grand_child_2')
+        connect_page_signals_handlers()
+        try:
+            page.move(JournalPage.objects.get(title='test_page_1'), pos='first-child')
+        finally:
+            disconnect_page_signals_handlers()
+
+        page = JournalPage.objects.get(title='test_page_1_grand_child_2')
+        self.assertEqual(page.reading_order, 1)
+        self.assertEqual(page.get_prev_page().title, 'test_page_1')
+        self.assertEqual(page.get_next_page().title, 'test_page_1_child_1')
+
+    def test_bread_crumbs_for_pages(self):
+        """
+        Test bread crumbs of many pages are resolved with a single query
+        """
+        JournalPage.objects.filter(title='test_page_1_child_1').update(live=False)
+        pages = list(JournalPage.objects.filter(title__in=[
+            'test_page_1',
+            'test_page_1_grand_child_1_grand_child_1',
+            'test_page_1_grand_child_2',
+        ]))
+
+        with self.assertNumQueries(1):
+            bread_crumbs = JournalPage.get_bread_crumbs_for_pages(pages, title_only=True)
+
+        pages = {page.title: page for page in pages}
+        self.assertEqual(bread_crumbs[pages['test_page_1'].id], [])
+        self.assertEqual(
+            bread_crumbs[pages['test_page_1_grand_child_1_grand_child_1'].id],
+            ['test_page_1', 'test_page_1_grand_child_1']
+        )
+        self.assertEqual(bread_crumbs[pages['test_page_1_grand_child_2'].id], ['test_page_1'])
+        self.assertEqual(
+            pages['test_page_1_grand_child_2'].get_bread_crumbs(),
+            [{'title': 'test_page_1', 'id': pages['test_page_1'].id}]
+        )
+
+    def test_journal_about_page_is_not_saved_on_read(self):
+        """
+        Test journal about page is calculated from the page path without being saved
+        """
+        JournalPage.objects.update(journal_about_page=None)
+        page = JournalPage.objects.get(title='test_page_1_grand_child_2')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(page.get_journal_about_page(), self.journal_about_page)
+        self.assertIsNone(JournalPage.objects.get(id=page.id).journal_about_page)
+
+    def test_update_journal_about_pages_command(self):
+        """
+        Test the management command fills the journal about page of every page in the journal
+        """
+        JournalPage.objects.update(journal_about_page=None)
+        page = JournalPage.objects.get(title='test_page_1_child_1')
+        link_ids = {'page': {str(page.id)}}
+        links_stamp = JournalRichTextBlock.get_links_stamp(link_ids)
+        generation = JournalAboutPage.get_search_generations([self.journal_about_page.id])
+
+        with mock.patch('journals.apps.journals.models.update_search_index') as update_search_index:
+            management.call_command('update_journal_about_pages', journal_ids=[self.journal.id])
+
+        self.assertFalse(JournalPage.objects.filter(journal_about_page__isnull=True).exists())
+        self.assertEqual(
+            JournalPage.objects.filter(journal_about_page=self.journal_about_page).count(),
+            self.journal_about_page.get_descendant_count()
+        )
+        self.assertIn(page, list(update_search_index.call_args[0][0]))
+        self.assertNotEqual(JournalRichTextBlock.get_links_stamp(link_ids), links_stamp)
+        self.assertNotEqual(JournalAboutPage.get_search_generations([self.journal_about_page.id]), generation)
+
+    def test_video_journal_lookup(self):
+        """
+        Test the journal of a video is looked up from the rows maintained on publish and unpublish
+        """
+        video = VideoFactory(block_id=uuid.uuid4())
+        page = JournalPage.objects.get(title='test_page_1_child_1')
+        page.body = [(VIDEO_BLOCK_TYPE, {'video': video, 'title': ''})]
+        page.save()
+
+        page = JournalPage.objects.get(id=page.id)
+        page.update_related_objects()
+        video = Video.objects.prefetch_related('video_journals').get(id=video.id)
+        with self.assertNumQueries(0):
+            self.assertIn('journal_uuid={}'.format(self.journal.uuid), video.view_access_url)
+
+        page.update_related_objects(clear=True)
+        video = Video.objects.get(id=video.id)
+        self.assertIsNone(video.get_journal_uuid())
+        self.assertIn('journal_uuid=0', video.view_access_url)
+
+    def test_navigation_without_about_page(self):
+        """
+        Test a page outside of any journal has no previous or next page
+        """
+        page = Site.objects.first().root_page.add_child(instance=JournalPage(title='page outside of a journal'))
+        self.assertIsNone(page.get_prev_page())
+        self.assertIsNone(page.get_next_page(live_only=False))
+
+    def test_video_journal_lookup_without_journal(self):
+        """
+        Test publishing or moving pages with videos under an about page whose journal was deleted adds no rows
+        """
+        video = VideoFactory(block_id=uuid.uuid4())
+        page = JournalPage.objects.get(title='test_page_1_child_1')
+        page.body = [(VIDEO_BLOCK_TYPE, {'video': video, 'title': ''})]
+        page.save()
+        page = JournalPage.objects.get(id=page.id)
+        page.update_related_objects()
+        self.assertTrue(VideoJournal.objects.filter(journal_page=page).exists())
+
+        JournalAboutPage.objects.filter(id=self.journal_about_page.id).update(journal=None)
+        journal_about_page = JournalAboutPage.objects.get(id=self.journal_about_page.id)
+        VideoJournal.set_pages_journal(JournalPage.objects.filter(id=page.id), journal_about_page)
+        self.assertFalse(VideoJournal.objects.filter(journal_page=page).exists())
+
+        page = JournalPage.objects.get(id=page.id)
+        page.update_related_objects()
+        self.assertFalse(VideoJournal.objects.filter(journal_page=page).exists())
+
+    def test_search_index_journal_ids(self):
+        """
+        Test the journal ids indexed with a video follow the pages using it, and that the
+        videos a page starts or stops using are reindexed
+        """
+        video = VideoFactory(block_id=uuid.uuid4())
+        page = JournalPage.objects.get(title='test_page_1_child_1')
+        page.body = [(VIDEO_BLOCK_TYPE, {'video': video, 'title': ''})]
+        page.save()
+        page = JournalPage.objects.get(id=page.id)
+        old_components = set(page.documents.all()) | set(page.images.all()) | set(page.videos.all())
+
+        with mock.patch('journals.apps.journals.models.update_search_index') as update_search_index:
+            page.update_related_objects()
+        self.assertEqual(update_search_index.call_args[0][0], old_components | {video})
+        self.assertEqual(video.journal_ids(), [self.journal.id])
+        self.assertEqual(page.journal_ids(), [self.journal.id])
+
+        with mock.patch('journals.apps.journals.models.update_search_index') as update_search_index:
+            page.update_related_objects(clear=True)
+        self.assertEqual(update_search_index.call_args[0][0], {video})
+        self.assertEqual(video.journal_ids(), [])
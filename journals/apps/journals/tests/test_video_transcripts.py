@@ -0,0 +1,121 @@
+"""
+Test Cases for the video transcript store
+"""
+import threading
+import time
+import zlib
+from collections import Counter
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from journals.apps.journals.models import Video, VideoTranscript
+
+TRANSCRIPT_URL = 'http://lms/transcript/en'
+
+
+def _response(status_code, content=b'', headers=None):
+    return mock.Mock(status_code=status_code, content=content, headers=headers or {}, raise_for_status=mock.Mock())
+
+
+class TestVideoTranscript(TestCase):
+    """
+    Test Cases for VideoTranscript
+    """
+
+    def setUp(self):
+        super(TestVideoTranscript, self).setUp()
+        self.video = Video.objects.create(block_id='block', display_name='video', view_url='http://lms/video',
+                                          transcript_url=TRANSCRIPT_URL, source_course_run='run')
+
+    def test_transcript_downloaded_once(self):
+        """
+        Test the transcript is downloaded the first time it is read, then read compressed from the store
+        """
+        response = _response(200, b'hello transcript', {'ETag': '"v1"', 'Last-Modified': 'Wed, 17 Oct 2018 10:00 GMT'})
+        with mock.patch('requests.get', return_value=response) as get:
+            self.assertEqual(self.video.transcript(), 'hello transcript')
+            self.assertEqual(self.video.transcript(), 'hello transcript')
+
+        self.assertEqual(get.call_count, 1)
+        transcript = VideoTranscript.objects.get(url=TRANSCRIPT_URL)
+        self.assertEqual(zlib.decompress(transcript.content), b'hello transcript')
+        self.assertEqual(transcript.etag, '"v1"')
+
+    def test_refresh_conditional(self):
+        """
+        Test refreshing sends the stored validators and only replaces the transcript when it changed
+        """
+        with mock.patch('requests.get', return_value=_response(200, b'v1', {'ETag': '"v1"'})):
+            self.assertEqual(VideoTranscript.refresh(TRANSCRIPT_URL)[1], True)
+
+        session = mock.Mock()
+        session.get.return_value = _response(304)
+        transcript, changed = VideoTranscript.refresh(TRANSCRIPT_URL, session)
+        self.assertFalse(changed)
+        self.assertEqual(transcript.text, 'v1')
+        self.assertEqual(session.get.call_args[1]['headers'], {'If-None-Match': '"v1"'})
+
+        session.get.return_value = _response(200, b'v2', {'ETag': '"v2"'})
+        transcript, changed = VideoTranscript.refresh(TRANSCRIPT_URL, session)
+        self.assertTrue(changed)
+        self.assertEqual(self.video.transcript(), 'v2')
+        self.assertEqual(VideoTranscript.objects.get(url=TRANSCRIPT_URL).etag, '"v2"')
+
+    def test_refresh_many(self):
+        """
+        Test refreshing many transcripts sends the stored validators and only stores the changed transcripts
+        """
+        stored = VideoTranscript.objects.create(url=TRANSCRIPT_URL, content=zlib.compress(b'stored'), etag='"v1"')
+        new_url = 'http://lms/transcript/new'
+
+        def get(url, headers, **kwargs):  # pylint: disable=unused-argument
+            """ The stored transcript is unchanged, the other one is new """
+            if url == TRANSCRIPT_URL:
+                self.assertEqual(headers, {'If-None-Match': '"v1"'})
+                return _response(304)
+            return _response(200, b'new')
+
+        session = mock.Mock()
+        session.get.side_effect = get
+        with mock.patch('journals.apps.journals.models.get_prefetch_session', return_value=session):
+            self.assertEqual(VideoTranscript.refresh_many([TRANSCRIPT_URL, new_url]), 1)
+
+        self.assertEqual(session.get.call_count, 2)
+        transcript = VideoTranscript.objects.get(url=TRANSCRIPT_URL)
+        self.assertEqual(transcript.text, 'stored')
+        self.assertGreater(transcript.checked_at, stored.checked_at)
+        self.assertEqual(VideoTranscript.objects.get(url=new_url).text, 'new')
+
+    @override_settings(SEARCH_INDEX_PREFETCH_WORKERS=4, SEARCH_INDEX_PREFETCH_PER_HOST=2)
+    def test_prefetch_concurrent(self):
+        """
+        Test the transcripts not stored yet are downloaded concurrently, with a limit per host
+        """
+        VideoTranscript.objects.create(url=TRANSCRIPT_URL, content=zlib.compress(b'stored'))
+        urls = ['http://{host}/transcript/{i}'.format(host=host, i=i) for host in ('lms1', 'lms2') for i in range(4)]
+        lock = threading.Lock()
+        running = Counter()
+        max_running = Counter()
+
+        def get(url, **kwargs):  # pylint: disable=unused-argument
+            """ Download slowly, recording the number of downloads running at once per host """
+            host = url.split('/')[2]
+            with lock:
+                running[host] += 1
+                max_running[host] = max(max_running[host], running[host])
+            time.sleep(0.05)
+            with lock:
+                running[host] -= 1
+            return _response(200, url.encode())
+
+        session = mock.Mock()
+        session.get.side_effect = get
+        with mock.patch('journals.apps.journals.models.get_prefetch_session', return_value=session):
+            VideoTranscript.prefetch(urls + [TRANSCRIPT_URL])
+
+        self.assertEqual(session.get.call_count, len(urls))
+        self.assertEqual(max_running, Counter({'lms1': 2, 'lms2': 2}))
+        for url in urls:
+            self.assertEqual(VideoTranscript.objects.get(url=url).text, url)
+        self.assertEqual(VideoTranscript.objects.get(url=TRANSCRIPT_URL).text, 'stored')
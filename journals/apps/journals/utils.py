@@ -4,12 +4,20 @@ Utility methods for journals
 import csv
 import datetime
 import hashlib
+import itertools
 import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import waffle
 from urllib.parse import urljoin, urlparse
+import requests
 import six
 
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 from wagtail.wagtailadmin import messages
+from wagtail.wagtailsearch.backends import get_search_backends
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +65,29 @@ def get_cache_key(**kwargs):
     return hashlib.md5(key.encode('utf-8')).hexdigest()
 
 
+def get_cache_stamps(stamp_keys):
+    """
+    Return a dict of each of stamp_keys to the stamp of the latest change of the data it
+    stands for, initialising the missing ones. Caches of values derived from that data are
+    keyed by its stamps, so moving them forward with touch_cache_stamps makes them miss and
+    the old entries simply expire.
+    """
+    stamps = cache.get_many(list(stamp_keys))
+    missing = {key: timezone.now().isoformat() for key in stamp_keys if key not in stamps}
+    if missing:
+        cache.set_many(missing, None)
+        stamps.update(missing)
+    return stamps
+
+
+def touch_cache_stamps(stamp_keys):
+    """
+    Move the stamps of stamp_keys forward, called when the data they stand for changes
+    """
+    stamp = timezone.now().isoformat()
+    cache.set_many({key: stamp for key in stamp_keys}, None)
+
+
 def get_image_url(site, image, rendition='original'):
     """
     Get image url for a given rendition, defaults to 'original'
@@ -140,5 +171,114 @@ def find_block(block_type, block_id_field, data, instance):
             instance.id == data.get('value').get(block_id_field))
 
 
+def update_search_index(objects):
+    """
+    Update the search index documents of objects, with one bulk request per model, or queue
+    the updates on backends configured with QUEUE_UPDATES.
+    Failures are logged and not raised, as wagtail does when indexing saved objects.
+    """
+    objects_by_model = {}
+    for obj in objects:
+        objects_by_model.setdefault(type(obj), []).append(obj)
+
+    for backend in get_search_backends(with_auto_update=True):
+        for model, model_objects in objects_by_model.items():
+            try:
+                backend.add_bulk(model, model_objects)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Exception raised while updating the search index of %d %s objects',
+                                 len(model_objects), model.__name__)
+
+
+def get_file_sha256(file):
+    """
+    Return the hex SHA-256 digest of the contents of file, read a chunk at a time
+    """
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def extract_pdf_text(file, max_length):
+    """
+    Return the plain text of the pages of the PDF file, up to max_length characters.
+    Files which can't be parsed are logged and have no text.
+    """
+    from PyPDF2 import PdfFileReader
+    pages_text = []
+    length = 0
+    try:
+        file.seek(0)
+        reader = PdfFileReader(file, strict=False)
+        for page_number in range(reader.getNumPages()):
+            page_text = reader.getPage(page_number).extractText()
+            pages_text.append(page_text)
+            length += len(page_text) + 1
+            if length >= max_length:
+                break
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Exception raised while extracting the text of PDF file %s', file.name)
+        return ''
+    return '\n'.join(pages_text)[:max_length]
+
+
+def iter_concurrently(func, items, get_host=None):
+    """
+    Call func on each of items from a pool of SEARCH_INDEX_PREFETCH_WORKERS threads, with at most
+    SEARCH_INDEX_PREFETCH_PER_HOST calls at once for the items of the same get_host(item).
+    Only a few items are in flight at any time, so the results don't pile up in memory.
+    func runs in other threads and must not use the database.
+    Yields:
+        (item, result) tuples as the calls complete, result is None if func raised
+    """
+    max_workers = settings.SEARCH_INDEX_PREFETCH_WORKERS
+    items = list(items)
+    semaphores = {}
+    if get_host is not None:
+        for item in items:
+            semaphores.setdefault(get_host(item), threading.BoundedSemaphore(settings.SEARCH_INDEX_PREFETCH_PER_HOST))
+
+    def call(item):
+        if get_host is None:
+            return func(item)
+        with semaphores[get_host(item)]:
+            return func(item)
+
+    remaining = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(call, item): item for item in itertools.islice(remaining, max_workers)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception('Exception raised while prefetching %r', item)
+                    result = None
+                for next_item in itertools.islice(remaining, 1):
+                    pending[executor.submit(call, next_item)] = next_item
+                yield item, result
+
+
+_prefetch_session = None
+
+
+def get_prefetch_session():
+    """
+    Return the requests session shared by the prefetch threads, keeping a connection
+    alive per thread and host
+    """
+    global _prefetch_session  # pylint: disable=global-statement
+    if _prefetch_session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.SEARCH_INDEX_PREFETCH_WORKERS)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _prefetch_session = session
+    return _prefetch_session
+
+
 def lms_integration_enabled():
     return not waffle.switch_is_active(DISABLE_LMS_WAFFLE_SWITCH)
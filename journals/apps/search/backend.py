@@ -3,35 +3,45 @@ Search backend module
 """
 from __future__ import absolute_import, unicode_literals
 
+import copy
 import logging
 
 from django.conf import settings
-from elasticsearch import NotFoundError
+from elasticsearch import TransportError
 
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import BulkIndexError, bulk
+from wagtail.wagtailsearch.backends.base import FieldError
 from wagtail.wagtailsearch.backends.elasticsearch5 import (
     Elasticsearch5Index, Elasticsearch5Mapping, Elasticsearch5SearchBackend,
     Elasticsearch5SearchQuery, Elasticsearch5SearchResults)
 from wagtail.wagtailsearch.index import class_is_indexed
 
+from journals.apps.search.models import IndexUpdate
+
 log = logging.getLogger(__name__)
 
 JOURNAL_DOCUMENT_INDEX_NAME = '{}__journals_journaldocument'.format(settings.WAGTAILSEARCH_BACKENDS['default']['INDEX'])
 JOURNAL_DOCUMENT_TYPE = 'wagtaildocs_abstractdocument_journals_journaldocument'
 JOURNAL_DOCUMENT_ATTACHMENT_CONTENT_FIELD = 'attachment.content'
-INGEST_ATTACHMENT_INDEX = '_ingest'
-INGEST_ATTACHMENT_DOC_TYPE = 'pipeline'
-INGEST_ATTACHMENT_ID = 'attachment'
-INGEST_ATTACHMENT_DATA_FIELD = 'data'
+# documents are up to MAX_ELASTICSEARCH_UPLOAD_SIZE each, keep only a few in memory while bulk indexing
+DOCUMENT_BULK_CHUNK_SIZE = 10
+DOCUMENT_BULK_MAX_CHUNK_BYTES = 2 * settings.MAX_ELASTICSEARCH_UPLOAD_SIZE
 VIDEO_DOCUMENT_TYPE = 'journals_video'
 VIDEO_DOCUMENT_TRANSCRIPT_FIELD = 'transcript'
-INGEST_PIPELINE_BODY = {
-    'description': 'Extract attachment information',
-    'processors': [
-        {INGEST_ATTACHMENT_ID: {'field': INGEST_ATTACHMENT_DATA_FIELD}}
-    ]
+SUGGEST_FIELD = 'suggest'
+SUGGEST_JOURNAL_CONTEXT = 'journal_id'
+SUGGEST_FIELD_PROPS = {
+    'type': 'completion',
+    'contexts': [
+        {'name': SUGGEST_JOURNAL_CONTEXT, 'type': 'category'},
+    ],
 }
 
+DEFAULT_HIGHLIGHT_FRAGMENT_SIZE = 150
+DEFAULT_HIGHLIGHT_NUMBER_OF_FRAGMENTS = 3
+
+RELEVANCE_SORT = [{'_score': 'desc'}, {'pk': 'asc'}]
+
 LARGE_TEXT_FIELD_SEARCH_PROPS = {
     'type': 'text',
     'analyzer': 'edgengram_analyzer',
@@ -43,6 +53,7 @@ LARGE_TEXT_FIELD_SEARCH_PROPS = {
 
 
 class JournalsearchMapping(Elasticsearch5Mapping):
+    '''Journal specific mapping, with document attachments and completion suggestions'''
 
     def get_mapping(self):
         '''
@@ -58,11 +69,11 @@ class JournalsearchMapping(Elasticsearch5Mapping):
             # and https://blog.ambar.cloud/highlighting-large-documents-in-elasticsearch/
             source_properties = {
                 '_source': {
-                    'excludes': [INGEST_ATTACHMENT_DATA_FIELD, JOURNAL_DOCUMENT_ATTACHMENT_CONTENT_FIELD]
+                    'excludes': [JOURNAL_DOCUMENT_ATTACHMENT_CONTENT_FIELD]
                 }
             }
             attachment_properties = {
-                'attachment.content': LARGE_TEXT_FIELD_SEARCH_PROPS
+                JOURNAL_DOCUMENT_ATTACHMENT_CONTENT_FIELD: LARGE_TEXT_FIELD_SEARCH_PROPS
             }
             mapping[self.get_document_type()].update(source_properties)
             mapping[self.get_document_type()]['properties'].update(attachment_properties)
@@ -75,88 +86,112 @@ class JournalsearchMapping(Elasticsearch5Mapping):
             }
             mapping[self.get_document_type()].update(source_properties)
 
+        if hasattr(self.model, 'get_suggest_inputs'):
+            mapping[self.get_document_type()]['properties'][SUGGEST_FIELD] = SUGGEST_FIELD_PROPS
+
         return mapping
 
+    def get_document(self, obj):
+        '''
+        Add the text extracted from journal documents, and the completion suggestions of the
+        objects of models with get_suggest_inputs, in the contexts of the journals they are shown in
+        '''
+        doc = super(JournalsearchMapping, self).get_document(obj)
+
+        if self.get_document_type() == JOURNAL_DOCUMENT_TYPE:
+            doc[JOURNAL_DOCUMENT_ATTACHMENT_CONTENT_FIELD] = obj.text()
+
+        if hasattr(obj, 'get_suggest_inputs'):
+            inputs = obj.get_suggest_inputs()
+            journal_ids = obj.journal_ids() if inputs else []
+            if journal_ids:
+                doc[SUGGEST_FIELD] = {
+                    'input': inputs,
+                    'contexts': {SUGGEST_JOURNAL_CONTEXT: [str(journal_id) for journal_id in journal_ids]},
+                }
+
+        return doc
+
 
 class JournalsearchIndex(Elasticsearch5Index):
     '''Journal specific backend to Elasticsearch5'''
 
-    def add_ingest_pipeline(self):
-        try:
-            try:
-                results = self.es.ingest.get_pipeline(id=INGEST_ATTACHMENT_ID)
-                log.info('Pipeline found for ingest attachment, results={results}'.format(results=results))
-            except NotFoundError:
-                results = self.es.ingest.put_pipeline(id=INGEST_ATTACHMENT_ID, body=INGEST_PIPELINE_BODY)
-                log.info('Created pipeline for ingest attachment, results={results}'.format(results=results))
-        except Exception as e:  # pylint: disable=broad-except
-            log.exception("Some Exception occurred while adding ingest pipeline. {e}".format(e=e))
-
-    def add_item(self, item):
+    def add_items(self, model, items):
         '''
-        Called when new item added to the index
-        Need to override to include pipeline attribute for ingest_plugin attachment
+        Called by update_index and process_index_updates management commands
+        Need to override so that the transcripts and document texts of a batch are fetched before
+        the documents are built, and the large texts of journal documents aren't all held in memory
         '''
-
-        # Make sure the object can be indexed
-        if not class_is_indexed(item.__class__):
+        if not class_is_indexed(model):
             return
 
+        if hasattr(model, 'prefetch_search_payloads'):
+            # fetch the transcripts or texts of the whole batch concurrently rather than one per document
+            items = list(items)
+            model.prefetch_search_payloads(items)
+
         # Get mapping
-        mapping = self.mapping_class(item.__class__)
+        mapping = self.mapping_class(model)
+
         if mapping.get_document_type() == JOURNAL_DOCUMENT_TYPE:
-            # sometime pipeline is missing. adding them to make sure they exists before using them in indexing)
-            self.add_ingest_pipeline()
-            results = self.es.index(
-                self.name,
-                mapping.get_document_type(),
-                mapping.get_document(item),
-                pipeline=INGEST_ATTACHMENT_ID,
-                id=mapping.get_document_id(item)
+            # Run the actions, created one at a time as bulk streams them in bounded chunks
+            bulk(
+                self.es,
+                self._get_document_actions(mapping, items),
+                chunk_size=DOCUMENT_BULK_CHUNK_SIZE,
+                max_chunk_bytes=DOCUMENT_BULK_MAX_CHUNK_BYTES,
             )
-            log.info('in add_item with attachment results={results}'.format(results=results))
         else:
-            super(JournalsearchIndex, self).add_item(item)
+            super(JournalsearchIndex, self).add_items(model, items)
 
-    def add_items(self, model, items):
+    def _get_document_actions(self, mapping, items):
         '''
-        Called by update_index management command
-        Need to override so that ingest_plugin attachment items get recreated correctly
+        Generate the bulk actions indexing items, so a document's text is only read
+        when its chunk is about to be sent
+        '''
+        doc_type = mapping.get_document_type()
+        for item in items:
+            action = {
+                '_index': self.name,
+                '_type': doc_type,
+                '_id': mapping.get_document_id(item),
+            }
+            action.update(mapping.get_document(item))
+            yield action
+
+    def delete_items(self, model, items):
+        '''
+        Delete the documents of items with a single bulk request, those already missing are ignored
         '''
         if not class_is_indexed(model):
             return
 
-        # Get mapping
         mapping = self.mapping_class(model)
-        doc_type = mapping.get_document_type()
-
-        if mapping.get_document_type() == JOURNAL_DOCUMENT_TYPE:
-            # Create list of actions
-            self.add_ingest_pipeline()
-            actions = []
-            for item in items:
-                # Create the action
-                action = {
-                    '_index': self.name,
-                    '_type': doc_type,
-                    '_id': mapping.get_document_id(item),
-                    'pipeline': INGEST_ATTACHMENT_ID,
-                }
-                action.update(mapping.get_document(item))
-                actions.append(action)
-
-                log.info('in add_items with attachment')
-            # Run the actions
-            bulk(self.es, actions)
-        else:
-            super(JournalsearchIndex, self).add_items(model, items)
+        actions = [
+            {
+                '_op_type': 'delete',
+                '_index': self.name,
+                '_type': mapping.get_document_type(),
+                '_id': mapping.get_document_id(item),
+            }
+            for item in items
+        ]
+        _, errors = bulk(self.es, actions, raise_on_error=False)
+        errors = [error for error in errors if error['delete'].get('status') != 404]
+        if errors:
+            raise BulkIndexError('{} document(s) failed to be deleted.'.format(len(errors)), errors)
 
 
 class JournalsearchSearchQuery(Elasticsearch5SearchQuery):
     '''Journal specific backend for SearchQuery'''
+    mapping_class = JournalsearchMapping
+
     def __init__(self, *args, **kwargs):
 
         super(JournalsearchSearchQuery, self).__init__(*args, **kwargs)
+        # (field name, values) filters on index fields that queryset filters can't express,
+        # like FilterFields of methods
+        self.terms_filters = []
         if self.mapping.get_document_type() == JOURNAL_DOCUMENT_TYPE:
             # add attachment.content to search fields so we can highlight
             if self.fields:
@@ -170,6 +205,26 @@ class JournalsearchSearchQuery(Elasticsearch5SearchQuery):
             else:
                 self.fields = ['_all', '_partials', VIDEO_DOCUMENT_TRANSCRIPT_FIELD]
 
+    def get_filters(self):
+        filters = super(JournalsearchSearchQuery, self).get_filters()
+
+        for field_name, values in self.terms_filters:
+            filters.append({'terms': {self.get_filter_column_name(field_name): list(values)}})
+
+        return filters
+
+    def get_filter_column_name(self, field_name):
+        """
+        Name in the index of the FilterField field_name of the model searched
+        """
+        field = self._get_filterable_field(field_name)
+        if field is None:
+            raise FieldError(
+                'Cannot filter search results with field "' + field_name + '". Please add index.FilterField(\'' +
+                field_name + '\') to ' + self.queryset.model.__name__ + '.search_fields.'
+            )
+        return self.mapping.get_field_column_name(field)
+
     def get_inner_query(self):
         '''
         Override to change the behavior of 'and' operator to make it function
@@ -202,9 +257,60 @@ class JournalsearchSearchQuery(Elasticsearch5SearchQuery):
 
 
 class JournalsearchSearchResults(Elasticsearch5SearchResults):
+    '''Journal specific backend for SearchResults, which can be run together in one msearch request'''
     fields_param_name = 'stored_fields'
 
-    def _do_search(self):
+    def __init__(self, *args, **kwargs):
+        super(JournalsearchSearchResults, self).__init__(*args, **kwargs)
+        self._search_after = None
+        # name to (field name, values counted) of the terms aggregations to compute along the hits
+        self._terms_aggregations = {}
+        # total number of matches in elasticsearch regardless of the limits, set once the search has run
+        self.hits_total = None
+        # name to the dict of term to number of matches of the terms aggregations, set once the search has run
+        self.term_counts = {}
+        # pk, score and sort values of the hits returned by elasticsearch, in their order, including the
+        # hits of objects missing from the database, set once the search has run
+        self.raw_hits = []
+
+    def _clone(self):
+        new = super(JournalsearchSearchResults, self)._clone()
+        new._search_after = self._search_after  # pylint: disable=protected-access
+        new._terms_aggregations = self._terms_aggregations  # pylint: disable=protected-access
+        return new
+
+    def search_after(self, sort_values):
+        """
+        Return results continuing after the hit with the given sort values, for deep paging
+        without the cost of a growing from offset
+        """
+        clone = self._clone()
+        clone._search_after = sort_values  # pylint: disable=protected-access
+        return clone
+
+    def aggregate_terms(self, name, field_name, values):
+        """
+        Return results that also count the matches for each of values of the index FilterField
+        field_name, in term_counts[name] once the search has run. Other values of the field, like
+        those of multi valued fields next to the values filtered on, are not counted.
+        """
+        terms_aggregations = dict(self._terms_aggregations)
+        terms_aggregations[name] = (field_name, values)
+        clone = self._clone()
+        clone._terms_aggregations = terms_aggregations  # pylint: disable=protected-access
+        return clone
+
+    def filter_terms(self, field_name, values):
+        """
+        Return results limited to the objects with any of values in the index FilterField field_name
+        """
+        clone = self._clone()
+        clone.query = copy.copy(self.query)
+        clone.query.terms_filters = self.query.terms_filters + [(field_name, values)]
+        return clone
+
+    def _get_search_params(self):
+        '''Index and body of the search request, sent on its own or as part of an msearch request'''
         # Params for elasticsearch query
         params = dict(
             index=self.backend.get_index_for_model(self.query.queryset.model).name,
@@ -214,30 +320,102 @@ class JournalsearchSearchResults(Elasticsearch5SearchResults):
         )
 
         # Add highlights
-        # TODO iterate over the fields in the query to generate this field list dynamically
         params['body']['highlight'] = {
-            'fields': {
-                '_all': {},
-                '_partials': {},
-                JOURNAL_DOCUMENT_ATTACHMENT_CONTENT_FIELD: {},
-                VIDEO_DOCUMENT_TRANSCRIPT_FIELD: {},
-            },
+            'fields': self._get_highlight_fields(),
+            'fragment_size': self.backend.highlight_fragment_size,
+            'number_of_fragments': self.backend.highlight_number_of_fragments,
             'pre_tags': ['<b>'],
             'post_tags': ['</b>']
         }
         params[self.fields_param_name] = 'pk'
 
+        if 'sort' not in params['body']:
+            # relevance order with the pk as tie breaker, so every hit has a unique position for search_after
+            params['body']['sort'] = RELEVANCE_SORT
+        if self._search_after is not None:
+            params['body']['search_after'] = self._search_after
+        if self._terms_aggregations:
+            params['body']['aggs'] = {
+                name: {'terms': {
+                    'field': self.query.get_filter_column_name(field_name),
+                    'include': [str(value) for value in values],
+                    'size': len(values),
+                }}
+                for name, (field_name, values) in self._terms_aggregations.items()
+            }
+
         # Add size if set
         if self.stop is not None:
             params['size'] = self.stop - self.start
 
+        return params
+
+    def _get_highlight_fields(self):
+        """
+        Highlight the fields the query searches in. Fields indexed with term vectors, the large
+        text fields, use the fast vector highlighter so it doesn't re-analyze their whole text.
+        """
+        mapping = self.query.mapping
+        properties = mapping.get_mapping()[mapping.get_document_type()]['properties']
+
+        highlight_fields = {}
+        for field in self.query.fields or ['_all', '_partials']:
+            if properties.get(field, {}).get('term_vector') == LARGE_TEXT_FIELD_SEARCH_PROPS['term_vector']:
+                highlight_fields[field] = {'type': 'fvh'}
+            else:
+                highlight_fields[field] = {}
+        return highlight_fields
+
+    def get_msearch_request(self):
+        """
+        Return the header and body lines of this search for an msearch request
+        """
+        params = self._get_search_params()
+        body = params['body']
+        body['_source'] = params['_source']
+        body['from'] = params['from_']
+        body[self.fields_param_name] = [params[self.fields_param_name]]
+        if 'size' in params:
+            body['size'] = params['size']
+
+        return [{'index': params['index']}, body]
+
+    def set_msearch_response(self, response):
+        """
+        Fill the results and count from this search's response of an msearch request
+        """
+        if 'error' in response:
+            raise TransportError(response.get('status', 'N/A'), response['error'])
+
+        self._results_cache = self._get_results_from_hits(response)
+
+        hit_count = self.hits_total - self.start
+        if self.stop is not None:
+            hit_count = min(hit_count, self.stop - self.start)
+        self._count_cache = max(hit_count, 0)
+
+    def _do_search(self):
         # Send to Elasticsearch
-        hits = self.backend.es.search(**params)
+        hits = self.backend.es.search(**self._get_search_params())
+        return self._get_results_from_hits(hits)
+
+    def _get_results_from_hits(self, hits):
+        '''Load the objects of the hits of a search response in their order, with their search metadata'''
+        self.hits_total = hits['hits']['total']
+        self.term_counts = {
+            name: {bucket['key']: bucket['doc_count'] for bucket in aggregation['buckets']}
+            for name, aggregation in hits.get('aggregations', {}).items()
+        }
 
         # Get pks from results
         pks = [hit['fields']['pk'][0] for hit in hits['hits']['hits']]
+        self.raw_hits = [
+            {'pk': str(hit['fields']['pk'][0]), 'score': hit['_score'], 'sort': hit.get('sort')}
+            for hit in hits['hits']['hits']
+        ]
         meta_info = {
-            str(hit['fields']['pk'][0]): [hit['_score'], hit.get('highlight', None)] for hit in hits['hits']['hits']
+            str(hit['fields']['pk'][0]): [hit['_score'], hit.get('highlight', None), hit.get('sort')]
+            for hit in hits['hits']['hits']
         }
 
         # Initialise results dictionary
@@ -252,25 +430,108 @@ class JournalsearchSearchResults(Elasticsearch5SearchResults):
                 score = meta_info.get(str(obj.pk))[0]
                 setattr(obj, self._score_field, score)
 
+            # sort values of the hit, the position to continue from with search_after
+            obj.search_results_metadata = {'sort': meta_info.get(str(obj.pk))[2]}
+
             # see if we have a highlight
             highlights = meta_info.get(str(obj.pk))[1]
             if highlights:
                 # let's flaten into a list of highlighs
                 values = highlights.values()
                 highlight_list = [item for sublist in values for item in sublist]
-                obj.search_results_metadata = {'highlights': highlight_list}
-            else:
-                obj.search_results_metadata = {}
+                obj.search_results_metadata['highlights'] = highlight_list
 
         # Return results in order given by Elasticsearch
         return [results[str(pk)] for pk in pks if results[str(pk)]]
 
 
 class JournalsearchSearchBackend(Elasticsearch5SearchBackend):
+    '''Journal specific backend to Elasticsearch5, with multi search and suggestions'''
     mapping_class = JournalsearchMapping
     index_class = JournalsearchIndex
     query_class = JournalsearchSearchQuery
     results_class = JournalsearchSearchResults
 
+    def __init__(self, params):
+        # size in characters and maximum number of the highlighted fragments returned per field
+        self.highlight_fragment_size = params.pop('HIGHLIGHT_FRAGMENT_SIZE', DEFAULT_HIGHLIGHT_FRAGMENT_SIZE)
+        self.highlight_number_of_fragments = params.pop(
+            'HIGHLIGHT_NUMBER_OF_FRAGMENTS', DEFAULT_HIGHLIGHT_NUMBER_OF_FRAGMENTS
+        )
+        # index writes of saved and deleted objects are queued, see journals.apps.search.index_queue
+        self.queue_updates = params.pop('QUEUE_UPDATES', False)
+        super(JournalsearchSearchBackend, self).__init__(params)
+
+    def add(self, obj):
+        if self.queue_updates:
+            IndexUpdate.enqueue([obj], IndexUpdate.ACTION_INDEX)
+        else:
+            super(JournalsearchSearchBackend, self).add(obj)
+
+    def add_bulk(self, model, obj_list):
+        if self.queue_updates:
+            IndexUpdate.enqueue(obj_list, IndexUpdate.ACTION_INDEX)
+        else:
+            super(JournalsearchSearchBackend, self).add_bulk(model, obj_list)
+
+    def delete(self, obj):
+        if self.queue_updates:
+            IndexUpdate.enqueue([obj], IndexUpdate.ACTION_DELETE)
+        else:
+            super(JournalsearchSearchBackend, self).delete(obj)
+
+    def suggest(self, models, prefix, journal_ids, size):
+        """
+        Get completion suggestions for prefix among the objects of models shown in the given journals,
+        with a single request to the suggest field of their indexes
+        Returns:
+            list of (text, model, pk) tuples, best suggestions first
+        """
+        models_by_type = {self.mapping_class(model).get_document_type(): model for model in models}
+        indexes = sorted(set(self.get_index_for_model(model).name for model in models))
+        body = {
+            '_source': False,
+            'suggest': {
+                SUGGEST_FIELD: {
+                    'prefix': prefix,
+                    'completion': {
+                        'field': SUGGEST_FIELD,
+                        'size': size,
+                        'contexts': {SUGGEST_JOURNAL_CONTEXT: [str(journal_id) for journal_id in journal_ids]},
+                    },
+                },
+            },
+        }
+
+        response = self.es.search(index=','.join(indexes), body=body)
+
+        suggestions = []
+        for option in response['suggest'][SUGGEST_FIELD][0]['options']:
+            model = models_by_type.get(option['_type'])
+            if model:
+                # document ids are <content type>:<pk>
+                suggestions.append((option['text'], model, int(option['_id'].rsplit(':', 1)[1])))
+        return suggestions
+
+    def multi_search(self, search_results_list):
+        """
+        Evaluate many lazy search results (as returned by queryset.search) in a single msearch
+        round trip. Iterating or counting them afterwards doesn't hit elasticsearch again.
+        """
+        search_results_list = [
+            search_results for search_results in search_results_list
+            if isinstance(search_results, JournalsearchSearchResults)
+        ]
+        if not search_results_list:
+            return
+
+        body = []
+        for search_results in search_results_list:
+            body.extend(search_results.get_msearch_request())
+
+        responses = self.es.msearch(body=body)['responses']
+        for search_results, response in zip(search_results_list, responses):
+            search_results.set_msearch_response(response)
+
 
 SearchBackend = JournalsearchSearchBackend
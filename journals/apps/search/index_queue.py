@@ -0,0 +1,134 @@
+"""
+Queued writes to the search index
+
+Backends configured with QUEUE_UPDATES record the objects to index or delete as
+IndexUpdate rows instead of writing to Elasticsearch while the object is saved. The
+process_index_updates command drains them: updates are coalesced per object, written
+with one bulk request per model and action, and retried with a growing delay on failure.
+The index_updated signal is sent once the documents of objects are written.
+"""
+import logging
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import models
+from django.dispatch import Signal
+from django.utils import timezone
+from wagtail.wagtailsearch.backends import get_search_backends
+
+from journals.apps.search.models import IndexUpdate
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+RETRY_DELAY = timedelta(seconds=30)
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+# sent by the model class with the objects whose documents have just been written to the index,
+# content derived from searches run since the objects changed can be invalidated again
+index_updated = Signal(providing_args=['objects'])
+
+
+def get_queueing_backends():
+    """ Return the auto update search backends whose writes go through the queue """
+    return [
+        backend for backend in get_search_backends(with_auto_update=True)
+        if getattr(backend, 'queue_updates', False)
+    ]
+
+
+def get_retry_delay(attempts):
+    """ Return the delay before retrying an update which failed attempts times """
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def process_index_updates(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Write the index updates due, at most batch_size of them, to the queueing backends
+    Returns:
+        number of updates processed, whether written or rescheduled
+    """
+    updates = list(
+        IndexUpdate.objects.filter(next_attempt_at__lte=timezone.now()).select_related(
+            'content_type'
+        ).order_by('next_attempt_at')[:batch_size]
+    )
+    if not updates:
+        return 0
+
+    backends = get_queueing_backends()
+    groups = {}
+    for update in updates:
+        groups.setdefault((update.content_type, update.action), []).append(update)
+
+    for (content_type, action), group in groups.items():
+        model = content_type.model_class()
+        written = []
+        try:
+            if model is not None:
+                written = _write_updates(backends, model, action, [update.object_id for update in group])
+        except Exception as e:  # pylint: disable=broad-except
+            log.exception('Exception raised while writing %d %s index updates of %s objects',
+                          len(group), action, model.__name__)
+            _reschedule(group, e)
+            continue
+
+        _done(group)
+        if written:
+            # a failing receiver must not get the updates written again
+            for receiver, response in index_updated.send_robust(sender=model, objects=written):
+                if isinstance(response, Exception):
+                    log.error('Exception raised by %r receiving index_updated of %d %s objects: %r',
+                              receiver, len(written), model.__name__, response)
+
+    return len(updates)
+
+
+def _write_updates(backends, model, action, object_ids):
+    """
+    Write the action on the documents of the objects of model with object_ids to backends
+    Returns:
+        the objects whose documents were written
+    """
+    if action == IndexUpdate.ACTION_INDEX:
+        objects = list(model.get_indexed_objects().filter(pk__in=object_ids))
+        # objects deleted since they were queued are removed from the index
+        found_ids = set(str(obj.pk) for obj in objects)
+        missing_ids = [object_id for object_id in object_ids if object_id not in found_ids]
+    else:
+        objects = []
+        missing_ids = object_ids
+    missing = [model(pk=model._meta.pk.to_python(object_id)) for object_id in missing_ids]
+
+    for backend in backends:
+        index = backend.get_index_for_model(model)
+        if objects:
+            index.add_items(model, objects)
+        if missing:
+            index.delete_items(model, missing)
+
+    return objects
+
+
+def _matching(updates):
+    """
+    Filter the updates unchanged since they were read, those queued again meanwhile are
+    left for the next run
+    """
+    return IndexUpdate.objects.filter(reduce(or_, (
+        models.Q(id=update.id, queued_at=update.queued_at) for update in updates
+    )))
+
+
+def _done(updates):
+    _matching(updates).delete()
+
+
+def _reschedule(updates, error):
+    attempts = max(update.attempts for update in updates) + 1
+    _matching(updates).update(
+        attempts=attempts,
+        next_attempt_at=timezone.now() + get_retry_delay(attempts),
+        last_error=str(error),
+    )
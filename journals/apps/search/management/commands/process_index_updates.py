@@ -0,0 +1,55 @@
+"""
+Management command to write the queued search index updates to Elasticsearch.
+Possible ways to run this command
+To write the updates queued so far and exit
+`./manage.py process_index_updates`
+
+To run as a worker, checking for new updates every 5 seconds
+`./manage.py process_index_updates --loop --sleep 5`
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from journals.apps.search.index_queue import DEFAULT_BATCH_SIZE, process_index_updates
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    '''Management command to process the search index update queue'''
+    help = 'Writes the queued search index updates in bulk, retrying the failed ones later'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch_size', dest='batch_size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Maximum number of updates read from the queue at once')
+        parser.add_argument('--loop', dest='loop', action='store_true',
+                            help='Keep processing new updates until interrupted')
+        parser.add_argument('--sleep', dest='sleep', type=float, default=5,
+                            help='Seconds to wait when the queue is empty, with --loop')
+
+    def drain(self, batch_size):
+        """
+        Process the updates due until none is left
+
+        Returns: number of updates processed
+        """
+        total = 0
+        while True:
+            processed = process_index_updates(batch_size)
+            total += processed
+            if processed < batch_size:
+                return total
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.drain(options['batch_size'])
+            if processed:
+                logger.info('Processed %d search index updates', processed)
+            if not options['loop']:
+                return
+            # don't keep the database connection open while idle
+            connection.close()
+            time.sleep(options['sleep'])
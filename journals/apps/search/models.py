@@ -0,0 +1,71 @@
+""" Search models. """
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+
+
+@python_2_unicode_compatible
+class IndexUpdate(models.Model):
+    """
+    Pending write of the search index document of an object, done in bulk by the
+    process_index_updates command. There is at most one per object, holding its latest action.
+    """
+    ACTION_INDEX = 'index'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = (
+        (ACTION_INDEX, 'Index'),
+        (ACTION_DELETE, 'Delete'),
+    )
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.CharField(max_length=255)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    queued_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta(object):
+        unique_together = ('content_type', 'object_id')
+
+    def __str__(self):
+        return '{action} {content_type} {object_id}'.format(
+            action=self.action, content_type=self.content_type, object_id=self.object_id
+        )
+
+    @classmethod
+    def enqueue(cls, objects, action):
+        """
+        Queue action on the index documents of objects, replacing the updates already
+        queued for them, so that each object is written once however often it changes
+        """
+        now = timezone.now()
+        updates = [
+            cls(content_type=ContentType.objects.get_for_model(obj), object_id=str(obj.pk), action=action,
+                queued_at=now, next_attempt_at=now)
+            for obj in objects
+        ]
+        if not updates:
+            return
+
+        try:
+            with transaction.atomic():
+                for content_type, object_ids in cls._group_object_ids(updates).items():
+                    cls.objects.filter(content_type=content_type, object_id__in=object_ids).delete()
+                cls.objects.bulk_create(updates)
+        except IntegrityError:
+            # another process queued some of the objects meanwhile, replace them one by one
+            for update in updates:
+                cls.objects.update_or_create(
+                    content_type=update.content_type, object_id=update.object_id,
+                    defaults={'action': action, 'queued_at': now, 'attempts': 0, 'next_attempt_at': now,
+                              'last_error': ''},
+                )
+
+    @staticmethod
+    def _group_object_ids(updates):
+        object_ids = {}
+        for update in updates:
+            object_ids.setdefault(update.content_type, []).append(update.object_id)
+        return object_ids
@@ -0,0 +1,139 @@
+"""
+Buffered logging of search query hits
+
+Recording a hit with wagtail's Query.add_hit does a get or create of the query and an
+upsert of its daily hits on every search. Here hits are counted in memory and written
+in bulk by a background flusher every SEARCH_QUERY_HITS_FLUSH_INTERVAL seconds.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, connection, models, transaction
+from django.utils import timezone
+from wagtail.wagtailsearch.models import Query, QueryDailyHits
+from wagtail.wagtailsearch.utils import normalise_query_string
+
+log = logging.getLogger(__name__)
+
+
+@transaction.atomic
+def save_query_hits(hits):
+    """
+    Add hits to the daily hits of their queries, with a fixed number of queries whatever
+    the number of query strings. Either all hits are saved or none, so a failed flush can
+    be retried without counting any of them twice.
+    Args:
+        hits: dict of (query string, date) to the number of hits
+    """
+    if not hits:
+        return
+
+    query_ids = _get_or_create_query_ids(set(query_string for query_string, _ in hits))
+    hits_by_query_id = Counter()
+    for (query_string, date), count in hits.items():
+        hits_by_query_id[(query_ids[query_string], date)] += count
+
+    daily_hits_ids = {
+        (query_id, date): daily_hits_id for daily_hits_id, query_id, date in QueryDailyHits.objects.filter(
+            query_id__in=set(query_id for query_id, _ in hits_by_query_id),
+            date__in=set(date for _, date in hits_by_query_id),
+        ).values_list('id', 'query_id', 'date')
+    }
+
+    # one update per distinct count for the existing rows
+    ids_by_count = {}
+    new_daily_hits = []
+    for (query_id, date), count in hits_by_query_id.items():
+        if (query_id, date) in daily_hits_ids:
+            ids_by_count.setdefault(count, []).append(daily_hits_ids[(query_id, date)])
+        else:
+            new_daily_hits.append(QueryDailyHits(query_id=query_id, date=date, hits=count))
+
+    for count, ids in ids_by_count.items():
+        QueryDailyHits.objects.filter(id__in=ids).update(hits=models.F('hits') + count)
+
+    if not new_daily_hits:
+        return
+
+    try:
+        with transaction.atomic():
+            QueryDailyHits.objects.bulk_create(new_daily_hits)
+    except IntegrityError:
+        # another process created some of the rows meanwhile, add to them one by one
+        for daily_hits in new_daily_hits:
+            existing, created = QueryDailyHits.objects.get_or_create(
+                query_id=daily_hits.query_id, date=daily_hits.date, defaults={'hits': daily_hits.hits}
+            )
+            if not created:
+                existing.hits = models.F('hits') + daily_hits.hits
+                existing.save()
+
+
+def _get_or_create_query_ids(query_strings):
+    """ Return a dict of query string to the id of its Query, creating the missing ones """
+    query_ids = dict(Query.objects.filter(query_string__in=query_strings).values_list('query_string', 'id'))
+    missing = query_strings.difference(query_ids)
+    if missing:
+        try:
+            with transaction.atomic():
+                Query.objects.bulk_create([Query(query_string=query_string) for query_string in missing])
+        except IntegrityError:
+            # another process created some of them meanwhile
+            for query_string in missing:
+                Query.objects.get_or_create(query_string=query_string)
+        query_ids.update(Query.objects.filter(query_string__in=missing).values_list('query_string', 'id'))
+    return query_ids
+
+
+class QueryHitsBuffer(object):
+    """
+    Counts query hits in memory until they are flushed to the database. The first hit
+    starts a daemon thread flushing every flush_interval seconds, unless it is None, in
+    which case hits are only written by flush().
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._hits = Counter()
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def add_hit(self, query_string):
+        """ Count a hit of query_string today """
+        key = (normalise_query_string(query_string), timezone.now().date())
+        with self._lock:
+            self._hits[key] += 1
+            if self.flush_interval is not None and self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, name='query-hits-flusher')
+                self._flusher.daemon = True
+                self._flusher.start()
+
+    def flush(self):
+        """ Write the buffered hits to the database """
+        with self._lock:
+            hits, self._hits = self._hits, Counter()
+        if not hits:
+            return
+
+        try:
+            save_query_hits(hits)
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Exception raised while saving %d search query hits, retrying on next flush', len(hits))
+            with self._lock:
+                self._hits.update(hits)
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            # the flusher thread has its own database connection, don't keep it open between flushes
+            connection.close()
+
+
+query_hits = QueryHitsBuffer(getattr(settings, 'SEARCH_QUERY_HITS_FLUSH_INTERVAL', 5))
+# hits still buffered by the process are flushed on exit
+atexit.register(query_hits.flush)
@@ -0,0 +1,260 @@
+"""
+Tests for the journals search backend
+"""
+import hashlib
+import shutil
+import tempfile
+import uuid
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from elasticsearch import TransportError
+from wagtail.wagtailcore.models import Site
+from wagtail.wagtailsearch.backends import get_search_backend
+
+from journals.apps.core.tests.factories import JournalFactory, OrganizationFactory
+from journals.apps.core.tests.utils import TEST_JOURNAL_STRUCTURE, create_journal_about_page_factory
+from journals.apps.journals.models import DocumentText, JournalDocument, JournalImage, JournalPage, Video
+from journals.apps.search.backend import (
+    DEFAULT_HIGHLIGHT_FRAGMENT_SIZE,
+    DEFAULT_HIGHLIGHT_NUMBER_OF_FRAGMENTS,
+    JOURNAL_DOCUMENT_ATTACHMENT_CONTENT_FIELD,
+    DOCUMENT_BULK_CHUNK_SIZE,
+    SUGGEST_FIELD,
+    VIDEO_DOCUMENT_TRANSCRIPT_FIELD,
+    JournalsearchMapping,
+)
+
+
+class TemporaryMediaRootMixin(object):
+    """
+    Writes the files of the documents created by the tests to a temporary media root
+    """
+
+    def setUp(self):
+        super(TemporaryMediaRootMixin, self).setUp()
+        self.media_root = tempfile.mkdtemp()
+        media_root_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_root_settings.enable()
+        self.addCleanup(media_root_settings.disable)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super(TemporaryMediaRootMixin, self).tearDown()
+
+
+class TestJournalsearchIndex(TemporaryMediaRootMixin, TestCase):
+    """
+    Test Cases for writing documents to the index
+    """
+
+    def setUp(self):
+        super(TestJournalsearchIndex, self).setUp()
+        self.contents = [b'%PDF document ' + str(i).encode() * i for i in range(3)]
+        self.documents = [
+            JournalDocument.objects.create(title='doc {}'.format(i), file=ContentFile(contents, name='doc.pdf'))
+            for i, contents in enumerate(self.contents)
+        ]
+
+    def test_document_text_extracted_once(self):
+        """
+        Test the text of documents is extracted once per distinct file contents
+        """
+        copy = JournalDocument.objects.create(title='copy', file=ContentFile(self.contents[0], name='copy.pdf'))
+        self.assertEqual(copy.file_sha256, hashlib.sha256(self.contents[0]).hexdigest())
+        self.assertEqual(copy.file_sha256, self.documents[0].file_sha256)
+
+        with mock.patch('journals.apps.journals.models.extract_pdf_text', return_value='pdf text') as extract:
+            self.assertEqual([document.text() for document in self.documents + [copy]], ['pdf text'] * 4)
+        self.assertEqual(extract.call_count, 3)
+
+        # documents saved before their hash was recorded
+        JournalDocument.objects.filter(pk=copy.pk).update(file_sha256='')
+        copy = JournalDocument.objects.get(pk=copy.pk)
+        with mock.patch('journals.apps.journals.models.extract_pdf_text') as extract:
+            self.assertEqual(copy.text(), 'pdf text')
+        extract.assert_not_called()
+        self.assertEqual(JournalDocument.objects.get(pk=copy.pk).file_sha256, self.documents[0].file_sha256)
+
+    def test_add_documents_prefetched(self):
+        """
+        Test the texts of the documents of a batch are extracted before their actions are built, once per contents
+        """
+        copy = JournalDocument.objects.create(title='copy', file=ContentFile(self.contents[0], name='copy.pdf'))
+        index = get_search_backend().get_index_for_model(JournalDocument)
+
+        actions = []
+        with mock.patch('journals.apps.journals.models.extract_pdf_text', return_value='pdf text') as extract, \
+                mock.patch('journals.apps.search.backend.bulk',
+                           side_effect=lambda es, documents, **kwargs: actions.extend(documents)):
+            index.add_items(JournalDocument, self.documents + [copy])
+
+        self.assertEqual(extract.call_count, 3)
+        self.assertEqual(DocumentText.objects.count(), 3)
+        self.assertEqual([action[JOURNAL_DOCUMENT_ATTACHMENT_CONTENT_FIELD] for action in actions], ['pdf text'] * 4)
+
+    def test_prefetch_extraction_failure(self):
+        """
+        Test a document whose text can't be extracted doesn't keep the texts of the others from being stored
+        """
+        with mock.patch('journals.apps.journals.models.extract_pdf_text',
+                        side_effect=[IOError('unreadable'), 'pdf text', 'pdf text']):
+            JournalDocument.prefetch_search_payloads(self.documents)
+
+        self.assertEqual(DocumentText.objects.count(), 2)
+
+    def test_add_documents_streamed(self):
+        """
+        Test documents are read one at a time while bulk consumes their actions, in bounded chunks
+        """
+        index = get_search_backend().get_index_for_model(JournalDocument)
+        read = []
+
+        def consume(es, actions, **kwargs):  # pylint: disable=unused-argument
+            for position, action in enumerate(actions):
+                # only the document of the action consumed has been read
+                self.assertEqual(len(read), position + 1)
+                self.assertEqual(action[JOURNAL_DOCUMENT_ATTACHMENT_CONTENT_FIELD], 'text')
+
+        with mock.patch.object(JournalDocument, 'text', autospec=True,
+                               side_effect=lambda document: read.append(document.id) or 'text'), \
+                mock.patch.object(JournalDocument, 'prefetch_search_payloads'), \
+                mock.patch('journals.apps.search.backend.bulk', side_effect=consume) as bulk:
+            index.add_items(JournalDocument, self.documents)
+
+        self.assertEqual(read, [document.id for document in self.documents])
+        self.assertEqual(bulk.call_args[1]['chunk_size'], DOCUMENT_BULK_CHUNK_SIZE)
+
+
+class TestJournalsearchSearchResults(TestCase):
+    """
+    Test Cases for the elasticsearch requests of JournalsearchSearchResults
+    """
+
+    def _get_highlight(self, model):
+        search_params = model.objects.search('query')._get_search_params()  # pylint: disable=protected-access
+        return search_params['body']['highlight']
+
+    def test_highlight_fields_of_query(self):
+        """
+        Test only the fields searched are highlighted, with the fast vector highlighter for large text fields
+        """
+        self.assertEqual(self._get_highlight(JournalPage)['fields'], {'_all': {}, '_partials': {}})
+        self.assertEqual(
+            self._get_highlight(JournalDocument)['fields'],
+            {'_all': {}, '_partials': {}, JOURNAL_DOCUMENT_ATTACHMENT_CONTENT_FIELD: {'type': 'fvh'}}
+        )
+        self.assertEqual(
+            self._get_highlight(Video)['fields'],
+            {'_all': {}, '_partials': {}, VIDEO_DOCUMENT_TRANSCRIPT_FIELD: {'type': 'fvh'}}
+        )
+
+    def test_highlight_fragments_limited(self):
+        """
+        Test the size and number of highlighted fragments are limited
+        """
+        highlight = self._get_highlight(JournalDocument)
+        self.assertEqual(highlight['fragment_size'], DEFAULT_HIGHLIGHT_FRAGMENT_SIZE)
+        self.assertEqual(highlight['number_of_fragments'], DEFAULT_HIGHLIGHT_NUMBER_OF_FRAGMENTS)
+
+    def test_multi_search(self):
+        """
+        Test many searches are sent as header and body pairs of one msearch request, and each
+        response is mapped back to its results, an error response raising
+        """
+        videos = [
+            Video.objects.create(block_id='block-{}'.format(i), display_name='video {}'.format(i),
+                                 view_url='http://video/{}'.format(i), transcript_url='', source_course_run='run')
+            for i in range(3)
+        ]
+        searches = [Video.objects.search('video')[:2], Video.objects.search('video')[2:3]]
+
+        def response(hit_videos, total):
+            return {'hits': {'total': total, 'hits': [
+                {'_score': 1.0, 'fields': {'pk': [video.pk]}, 'sort': [1.0, str(video.pk)]} for video in hit_videos
+            ]}}
+
+        responses = [response(videos[:2], 3), response(videos[2:], 3)]
+        with mock.patch('elasticsearch.Elasticsearch.msearch', return_value={'responses': responses}) as msearch:
+            get_search_backend().multi_search(searches)
+
+        body = msearch.call_args[1]['body']
+        self.assertEqual(len(body), 4)
+        index_name = get_search_backend().get_index_for_model(Video).name
+        for (header, search_body), (start, size) in zip(zip(body[::2], body[1::2]), [(0, 2), (2, 1)]):
+            self.assertEqual(header, {'index': index_name})
+            self.assertEqual((search_body['from'], search_body['size']), (start, size))
+            self.assertEqual(search_body['stored_fields'], ['pk'])
+            self.assertFalse(search_body['_source'])
+
+        # the results are filled without searching again
+        with mock.patch('elasticsearch.Elasticsearch.search') as search:
+            self.assertEqual(list(searches[0]), videos[:2])
+            self.assertEqual(searches[0].count(), 2)
+            self.assertEqual(list(searches[1]), videos[2:])
+            self.assertEqual(searches[1].count(), 1)
+        search.assert_not_called()
+
+        searches = [Video.objects.search('video'), Video.objects.search('other')]
+        responses = [response(videos, 3), {'error': {'type': 'search_phase_execution_exception'}, 'status': 400}]
+        with mock.patch('elasticsearch.Elasticsearch.msearch', return_value={'responses': responses}):
+            with self.assertRaises(TransportError) as context:
+                get_search_backend().multi_search(searches)
+        self.assertEqual(context.exception.status_code, 400)
+        self.assertEqual(list(searches[0]), videos)
+
+
+class TestJournalsearchSuggest(TemporaryMediaRootMixin, TestCase):
+    """
+    Test Cases for the completion suggestions
+    """
+
+    def setUp(self):
+        super(TestJournalsearchSuggest, self).setUp()
+        site = Site.objects.first()
+        self.journal = JournalFactory(organization=OrganizationFactory(site=site), uuid=uuid.uuid4())
+        create_journal_about_page_factory(
+            journal=self.journal,
+            journal_structure=TEST_JOURNAL_STRUCTURE,
+            root_page=site.root_page,
+            about_page_slug='suggest-about-page'
+        )
+
+    def test_suggest_document(self):
+        """
+        Test live pages and the videos they show are indexed with suggestions in the context of their journal
+        """
+        page = JournalPage.objects.get(title='test_page_1')
+        page.author = 'author name'
+        video = page.videos.first()
+
+        self.assertEqual(
+            JournalsearchMapping(JournalPage).get_document(page)[SUGGEST_FIELD],
+            {'input': ['test_page_1', 'author name'], 'contexts': {'journal_id': [str(self.journal.id)]}}
+        )
+        self.assertEqual(
+            JournalsearchMapping(Video).get_document(video)[SUGGEST_FIELD]['input'],
+            [video.display_name]
+        )
+
+        page.live = False
+        self.assertNotIn(SUGGEST_FIELD, JournalsearchMapping(JournalPage).get_document(page))
+
+    def test_suggest(self):
+        """
+        Test suggestions are requested for the given journals in one request and mapped back to their objects
+        """
+        page = JournalPage.objects.get(title='test_page_1')
+        response = {'suggest': {SUGGEST_FIELD: [{'options': [
+            {'text': 'test_page_1', '_type': 'wagtailcore_page_journals_journalpage',
+             '_id': 'wagtailcore_page:{}'.format(page.id), '_score': 1.0},
+        ]}]}}
+
+        with mock.patch('elasticsearch.Elasticsearch.search', return_value=response) as search:
+            suggestions = get_search_backend().suggest([JournalPage, JournalImage, Video], 'test', [self.journal.id], 5)
+
+        self.assertEqual(suggestions, [('test_page_1', JournalPage, page.id)])
+        completion = search.call_args[1]['body']['suggest'][SUGGEST_FIELD]['completion']
+        self.assertEqual(completion['contexts'], {'journal_id': [str(self.journal.id)]})
+        self.assertEqual(completion['size'], 5)
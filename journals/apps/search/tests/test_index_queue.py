@@ -0,0 +1,150 @@
+"""
+Tests for the search index update queue
+"""
+import uuid
+
+import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from elasticsearch.helpers import BulkIndexError
+from wagtail.wagtailcore.models import Site
+
+from journals.apps.core.tests.factories import JournalFactory, OrganizationFactory
+from journals.apps.core.tests.utils import TEST_JOURNAL_STRUCTURE, create_journal_about_page_factory
+from journals.apps.journals.models import JournalAboutPage, JournalPage, Video
+from journals.apps.search.backend import JournalsearchIndex
+from journals.apps.search.index_queue import get_retry_delay, index_updated, process_index_updates
+from journals.apps.search.models import IndexUpdate
+
+
+@override_settings(WAGTAILSEARCH_BACKENDS={
+    'default': dict(settings.WAGTAILSEARCH_BACKENDS['default'], QUEUE_UPDATES=True),
+})
+class TestIndexQueue(TestCase):
+    """
+    Test Cases for queued index updates
+    """
+
+    def setUp(self):
+        super(TestIndexQueue, self).setUp()
+        self.videos = [
+            Video.objects.create(block_id='block-{}'.format(i), display_name='video {}'.format(i),
+                                 view_url='http://video/{}'.format(i), transcript_url='', source_course_run='run')
+            for i in range(3)
+        ]
+
+    def _queued(self):
+        return dict(IndexUpdate.objects.values_list('object_id', 'action'))
+
+    def test_saves_and_deletes_coalesced(self):
+        """
+        Test saving and deleting objects queues a single update per object, with its latest action
+        """
+        self.assertEqual(self._queued(), {str(video.pk): IndexUpdate.ACTION_INDEX for video in self.videos})
+
+        video_id = str(self.videos[0].pk)
+        self.videos[0].display_name = 'renamed'
+        self.videos[0].save()
+        self.videos[0].delete()
+
+        queued = self._queued()
+        self.assertEqual(len(queued), 3)
+        self.assertEqual(queued[video_id], IndexUpdate.ACTION_DELETE)
+
+    def test_process_writes_bulk_per_model_and_action(self):
+        """
+        Test the queued updates are written with one bulk request per model and action, and removed
+        """
+        deleted_id = self.videos[0].pk
+        self.videos[0].delete()
+
+        with mock.patch.object(JournalsearchIndex, 'add_items') as add_items, \
+                mock.patch.object(JournalsearchIndex, 'delete_items') as delete_items:
+            call_command('process_index_updates')
+
+        add_items.assert_called_once_with(Video, self.videos[1:])
+        self.assertEqual(delete_items.call_count, 1)
+        self.assertEqual([video.pk for video in delete_items.call_args[0][1]], [deleted_id])
+        self.assertFalse(IndexUpdate.objects.exists())
+
+    def test_failed_updates_retried_later(self):
+        """
+        Test updates failing to be written are kept with a retry delay
+        """
+        with mock.patch.object(JournalsearchIndex, 'add_items', side_effect=BulkIndexError('failed', [])):
+            self.assertEqual(process_index_updates(), 3)
+
+        updates = IndexUpdate.objects.all()
+        self.assertEqual(len(updates), 3)
+        for update in updates:
+            self.assertEqual(update.attempts, 1)
+            self.assertIn('failed', update.last_error)
+            self.assertGreater(update.next_attempt_at, timezone.now() + get_retry_delay(1) / 2)
+
+        # not due yet
+        with mock.patch.object(JournalsearchIndex, 'add_items') as add_items:
+            self.assertEqual(process_index_updates(), 0)
+        add_items.assert_not_called()
+
+    def test_failing_receiver_does_not_retry(self):
+        """
+        Test updates written are removed from the queue even when an index_updated receiver fails
+        """
+        receiver = mock.Mock(side_effect=ValueError('failed'))
+        index_updated.connect(receiver, sender=Video, weak=False)
+        self.addCleanup(index_updated.disconnect, receiver, sender=Video)
+
+        with mock.patch.object(JournalsearchIndex, 'add_items'):
+            self.assertEqual(process_index_updates(), 3)
+
+        receiver.assert_called_once()
+        self.assertFalse(IndexUpdate.objects.exists())
+
+    def test_updates_queued_while_processing_kept(self):
+        """
+        Test an object queued again while its update is written is written again on the next run
+        """
+        video = self.videos[0]
+
+        def requeue(model, items):  # pylint: disable=unused-argument
+            IndexUpdate.enqueue([video], IndexUpdate.ACTION_INDEX)
+
+        with mock.patch.object(JournalsearchIndex, 'add_items', side_effect=requeue):
+            process_index_updates()
+
+        self.assertEqual(self._queued(), {str(video.pk): IndexUpdate.ACTION_INDEX})
+
+    def test_search_results_invalidated_once_written(self):
+        """
+        Test the cached search results of the journals of the pages and media written are invalidated
+        """
+        cache.clear()
+        site = Site.objects.first()
+        about_pages = [
+            create_journal_about_page_factory(
+                journal=JournalFactory(organization=OrganizationFactory(site=site), uuid=uuid.uuid4()),
+                journal_structure=TEST_JOURNAL_STRUCTURE,
+                root_page=site.root_page,
+                about_page_slug='index-queue-about-page-{}'.format(i)
+            )
+            for i in range(3)
+        ]
+        page = JournalPage.objects.filter(journal_about_page=about_pages[0]).first()
+        video = JournalPage.objects.filter(
+            journal_about_page=about_pages[1], videos__isnull=False
+        ).first().videos.first()
+        IndexUpdate.objects.all().delete()
+        IndexUpdate.enqueue([page, video], IndexUpdate.ACTION_INDEX)
+
+        journal_about_ids = [about_page.id for about_page in about_pages]
+        generations = JournalAboutPage.get_search_generations(journal_about_ids)
+        with mock.patch.object(JournalsearchIndex, 'add_items'):
+            process_index_updates()
+
+        new_generations = JournalAboutPage.get_search_generations(journal_about_ids)
+        self.assertNotEqual(new_generations[about_pages[0].id], generations[about_pages[0].id])
+        self.assertNotEqual(new_generations[about_pages[1].id], generations[about_pages[1].id])
+        self.assertEqual(new_generations[about_pages[2].id], generations[about_pages[2].id])
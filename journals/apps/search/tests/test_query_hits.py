@@ -0,0 +1,63 @@
+"""
+Tests for buffered search query hits
+"""
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+from wagtail.wagtailsearch.models import Query
+
+from journals.apps.search.query_hits import QueryHitsBuffer
+
+
+class TestQueryHitsBuffer(TestCase):
+    """
+    Test Cases for QueryHitsBuffer
+    """
+
+    def test_hits_written_in_bulk_on_flush(self):
+        """
+        Test hits are only written on flush, with the query strings normalized like wagtail does
+        """
+        Query.get('existing query').add_hit()
+        buffer = QueryHitsBuffer(flush_interval=None)
+
+        for query_string in ('Existing query', 'existing  query!', 'new query'):
+            buffer.add_hit(query_string)
+        self.assertEqual(Query.get('existing query').hits, 1)
+        self.assertFalse(Query.objects.filter(query_string='new query').exists())
+
+        # in a transaction, look the queries up, create the missing one in a savepoint and get its id,
+        # look the daily hits up, update the existing one and create the missing one in a savepoint
+        with self.assertNumQueries(12):
+            buffer.flush()
+
+        self.assertEqual(Query.get('existing query').hits, 3)
+        self.assertEqual(Query.get('new query').hits, 1)
+        self.assertEqual(
+            list(Query.get('new query').daily_hits.values_list('date', flat=True)),
+            [timezone.now().date()]
+        )
+
+        with self.assertNumQueries(0):
+            buffer.flush()
+
+    def test_failed_flush_retried_once(self):
+        """
+        Test hits whose flush failed part way are kept for the next flush, and only counted once
+        """
+        Query.get('existing query').add_hit()
+        buffer = QueryHitsBuffer(flush_interval=None)
+        buffer.add_hit('existing query')
+        buffer.add_hit('new query')
+
+        # the existing daily hits are updated before the new ones fail to be created
+        with mock.patch('wagtail.wagtailsearch.models.QueryDailyHits.objects.bulk_create',
+                        side_effect=DatabaseError):
+            buffer.flush()
+        self.assertEqual(Query.get('existing query').hits, 1)
+
+        buffer.flush()
+        self.assertEqual(Query.get('existing query').hits, 2)
+        self.assertEqual(Query.get('new query').hits, 1)
@@ -327,6 +327,11 @@ WAGTAILSEARCH_BACKENDS = {
         'TIMEOUT': 20,
         'OPTIONS': {'max_retries': 2, 'retry_on_timeout': True},
         'INDEX_SETTINGS': {},
+        'HIGHLIGHT_FRAGMENT_SIZE': 150,
+        'HIGHLIGHT_NUMBER_OF_FRAGMENTS': 3,
+        # queue the index writes of saved and deleted objects, only when a worker runs
+        # `./manage.py process_index_updates --loop` to write them
+        'QUEUE_UPDATES': False,
     }
 }
 
@@ -346,3 +351,6 @@ ALLOWED_DOCUMENT_FILE_EXTENSIONS = ['.pdf']
 
 BATCH_SIZE_FOR_LMS_USER_API = 50
 MAX_ELASTICSEARCH_UPLOAD_SIZE = 10000000  # maximum number of bytes per document that can be uploaded to elasticsearch
+SEARCH_QUERY_HITS_FLUSH_INTERVAL = 5  # seconds between writes of the buffered search query hits
+SEARCH_INDEX_PREFETCH_WORKERS = 8  # threads fetching transcripts and hashing documents of a batch being indexed
+SEARCH_INDEX_PREFETCH_PER_HOST = 4  # of which at most this many download from the same host at once
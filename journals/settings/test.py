@@ -52,3 +52,6 @@ DATABASES = {
 LOGGING['handlers']['local'] = {
     'class': 'logging.NullHandler',
 }
+
+# hits are written when the tests flush them, not by a background thread
+SEARCH_QUERY_HITS_FLUSH_INTERVAL = None